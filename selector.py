@@ -1,12 +1,36 @@
 """selector - WSGI handler delegation. (AKA routing.)"""
 
+import copy
+import gc
+import hashlib
+import json
+import os
 import re
+import threading
 
-from itertools import starmap
+from bisect import bisect_right
+from collections import Counter, OrderedDict
+from heapq import heapify, heappop, heappush, merge
+from itertools import chain, islice, repeat, starmap
 from wsgiref.util import shift_path_info
 
+try:
+    from urllib.parse import quote
+except ImportError:  # Python 2
+    from urllib import quote
+
 import resolver
 
+try:
+    _replace = os.replace
+except AttributeError:  # Python 2, where rename replaces on POSIX
+    _replace = os.rename
+
+try:
+    from re import _parser as _regex_parser
+except ImportError:  # Before Python 3.11
+    import sre_parse as _regex_parser
+
 
 class MappingFileError(Exception):
     """Raised to signal a syntax error in a mapping file."""
@@ -18,8 +42,12 @@ class PathExpressionParserError(Exception):
 
 def method_not_allowed(environ, start_response):
     """Default WSGI 405 app."""
+    methods = environ['selector.methods']
+    allow = getattr(methods, 'header', None)
+    if allow is None:
+        allow = ', '.join(methods)
     start_response("405 Method Not Allowed",
-                   [('Allow', ', '.join(environ['selector.methods'])),
+                   [('Allow', allow),
                     ('Content-Type', 'text/plain')])
     return ["405 Method Not Allowed\n\n"
             "The method specified in the Request-Line is not allowed "
@@ -33,11 +61,1829 @@ def not_found(environ, start_response):
             "The server has not found anything matching the Request-URI."]
 
 
+def _anchored(pattern):
+    """Tell whether regex string `pattern` can only match at its start.
+
+    True for a leading ``^`` with no top-level ``|``, which covers
+    everything `SimpleParser` produces.
+    """
+    if not pattern.startswith('^'):
+        return False
+    depth = 0
+    i, n = 1, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '\\':
+            i += 1
+        elif c == '[':
+            # Skip the character class; a leading ] (or ^]) is literal.
+            i += 1
+            if pattern[i:i + 1] == '^':
+                i += 1
+            if pattern[i:i + 1] == ']':
+                i += 1
+            while i < n and pattern[i] != ']':
+                if pattern[i] == '\\':
+                    i += 1
+                i += 1
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and depth == 0:
+            return False
+        i += 1
+    return True
+
+
+_named_group = re.compile(r'\\.|\(\?P<\w+>|\(\?P=|\(\?\(')
+
+
+def _ungrouped(pattern):
+    """Return `pattern` with its named groups made non-capturing.
+
+    Returns None if the pattern refers back to its own groups, since
+    those references would not survive the rewrite.
+    """
+    if re.search(r'\\[1-9]', pattern.replace('\\\\', '')):
+        return None
+    parts = []
+    last = 0
+    for found in _named_group.finditer(pattern):
+        token = found.group(0)
+        if token.startswith('\\'):
+            continue
+        if not token.startswith('(?P<'):
+            return None
+        parts.append(pattern[last:found.start()])
+        parts.append('(?:')
+        last = found.end()
+    parts.append(pattern[last:])
+    return ''.join(parts)
+
+
+def _unanchored(regex):
+    """Return a regex to run as ``match(path, pos)`` in place of `regex`.
+
+    That is the pattern without its leading ``^``, which would only
+    match at the start of the whole string. Returns None if the regex is
+    not `_anchored` or is multiline.
+    """
+    pattern = getattr(regex, 'pattern', None)
+    if (pattern is None or not _anchored(pattern) or
+            regex.flags & re.MULTILINE):
+        return None
+    return re.compile(pattern[1:], regex.flags)
+
+
+def _matches(matcher, path, pos):
+    """Return ``matcher.matches(path[pos:])``, without the slice if it can.
+
+    Matchers that can match from an offset have a ``matches_at`` method
+    (see `LinearMatcher.matches_at`). The others, like `TrieMatcher`,
+    set it to None and get the slice.
+    """
+    if not pos:
+        return matcher.matches(path)
+    matches_at = getattr(matcher, 'matches_at', None)
+    if matches_at is None:
+        return matcher.matches(path[pos:])
+    return matches_at(path, pos)
+
+
+_quantifiers = ('?', '*', '+', '{')
+
+try:
+    re.compile('a++')
+    #: Whether `re` has possessive quantifiers (Python 3.11 and up).
+    _possessive = True
+except re.error:
+    _possessive = False
+
+#: `SimpleParser` type patterns that never match a ``/``.
+_segment_patterns = frozenset([r'\w+', r'[a-zA-Z]+', r'\d+',
+                               r'[^/^.]+', r'[^/]+'])
+
+
+def _expand_literals(pattern, i, limit):
+    """Expand the literal regex sequence starting at `pattern[i]`.
+
+    Returns the list of strings it matches and the index where it ended.
+    Raises ValueError on anything but literals and optional groups.
+    """
+    variants = ['']
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '\\':
+            c = pattern[i + 1:i + 2]
+            if not c or c.isalnum():
+                raise ValueError(pattern)
+            options = [c]
+            i += 2
+        elif c == '(':
+            if pattern.startswith('(?:', i):
+                i += 3
+            elif pattern.startswith('(?', i):
+                raise ValueError(pattern)
+            else:
+                i += 1
+            options, i = _expand_literals(pattern, i, limit)
+            if pattern[i:i + 1] != ')':
+                raise ValueError(pattern)
+            i += 1
+            if pattern[i:i + 1] == '?':
+                options = [''] + options
+                i += 1
+        elif c in ')$':
+            break
+        elif c in '.^*+?{}[]|':
+            raise ValueError(pattern)
+        else:
+            options = [c]
+            i += 1
+        if pattern[i:i + 1] in _quantifiers:
+            raise ValueError(pattern)
+        variants = [v + o for v in variants for o in options]
+        if len(variants) > limit:
+            raise ValueError(pattern)
+    return variants, i
+
+
+def _literal_paths(pattern, limit=64):
+    """Return the paths regex string `pattern` matches exactly, if few.
+
+    Works for anchored patterns made of literal characters and optional
+    groups, like ``^\\/login(\\/)?$``. Returns None for anything else.
+    """
+    if not hasattr(pattern, 'startswith') or not pattern.startswith('^'):
+        return None
+    try:
+        variants, i = _expand_literals(pattern, 1, limit)
+    except ValueError:
+        return None
+    if pattern[i:] != '$':
+        return None
+    return tuple(sorted(set(variants)))
+
+
+def _measure(nodes, patterns):
+    """Return the least length and the least and most ``/`` count.
+
+    The most is None when a capture's type might match a ``/``.
+    """
+    length = least = 0
+    most = 0
+    for node in nodes:
+        if node[0] == 'literal':
+            length += len(node[1])
+            least += node[1].count('/')
+            if most is not None:
+                most += node[1].count('/')
+        elif node[0] == 'capture':
+            pattern = patterns.get(node[2], '')
+            if pattern.endswith('+') and '|' not in pattern:
+                length += 1
+            if pattern not in _segment_patterns:
+                most = None
+        else:
+            inner = _measure(node[1], patterns)[2]
+            if most is not None:
+                most = None if inner is None else most + inner
+    return length, least, most
+
+
+def _head(path):
+    """Return path up to and including its first ``/`` after the start."""
+    end = path.find('/', 1)
+    if end < 1:
+        return None
+    return path[:end + 1]
+
+
+def _features(nodes, openended, patterns):
+    """Work out cheap facts about the paths an expression can match.
+
+    Takes the `SimpleParser.parse` nodes of the expression. Returns
+    ``(prefix, least_slashes, most_slashes, least_length, suffix)``,
+    where prefix and suffix are the literal text every matching path
+    starts and ends with and most_slashes may be None for no limit.
+    """
+    length, least, most = _measure(nodes, patterns)
+    prefix = []
+    for node in nodes:
+        if node[0] != 'literal':
+            break
+        prefix.append(node[1])
+    suffix = []
+    if openended:
+        most = None
+    else:
+        for node in reversed(nodes[len(prefix):]):
+            if node[0] != 'literal':
+                break
+            suffix.insert(0, node[1])
+    return ''.join(prefix), least, most, length, ''.join(suffix)
+
+
+def _layout(groupindex, converters=()):
+    """Work out how `Selector.lean_args` hands on the groups of a regex.
+
+    Takes the regex's ``groupindex`` and the mapping's converters.
+    Returns ``(numbers, names, labels, converters)``: the group numbers
+    and names of the routing args, positional ones first in order, then
+    the labels of the named ones, and ``(position, converter)`` pairs.
+    Labels are names without any ``__pos``.
+    """
+    positional, named = [], []
+    for name, number in groupindex.items():
+        label = name[5:] if name.startswith('__pos') else name
+        if label.isdigit():
+            positional.append((label, number, name))
+        else:
+            named.append((label, number, name))
+    positional.sort()
+    named.sort()
+    order = positional + named
+    convert = dict(converters)
+    return (tuple(number for label, number, name in order),
+            tuple(name for label, number, name in order),
+            tuple(label for label, number, name in named),
+            tuple((position, convert[name])
+                  for position, (label, number, name) in enumerate(order)
+                  if name in convert))
+
+
+def _layout_of(mapping):
+    """Return the `_layout` of a mapping, working it out if need be."""
+    layout = getattr(mapping, 'layout', None)
+    if layout is None:
+        layout = _layout(mapping[0].groupindex,
+                         getattr(mapping, 'converters', None) or ())
+        if isinstance(mapping, (Mapping, Route)):
+            mapping.layout = layout
+    return layout
+
+
+def _parse(parser, expression):
+    """Return the `SimpleParser.parse` tree of an expression, or None.
+
+    Gives None if the parser has no ``parse`` or it can't take the
+    expression apart.
+    """
+    if not hasattr(parser, 'parse'):
+        return None
+    try:
+        return parser.parse(expression)
+    except (ValueError, PathExpressionParserError):
+        return None
+
+
+def _tree(mapping):
+    """Return the parse tree of a mapping's expression, or None.
+
+    It is kept on `Mapping` and `Route` objects, as working it out takes
+    a parse.
+    """
+    tree = getattr(mapping, 'tree', None)
+    if tree is False:
+        tree = _parse(mapping.parser, mapping.expression)
+        mapping.tree = tree
+    return tree
+
+
+def _facts(regex, parser, tree):
+    """Work out the facts a `Mapping` keeps from its parse tree.
+
+    Returns ``(literals, features, typed)``: the exact paths the regex
+    can match (see `_literal_paths`), the `_features` of the expression
+    and ``(group_name, type_name)`` pairs for the captures the parser
+    has converters for (see `SimpleParser`). Those that need the tree
+    are None (or empty, for typed) if tree is None.
+    """
+    literals = _literal_paths(getattr(regex, 'pattern', None))
+    if tree is None:
+        return literals, None, ()
+    nodes, openended = tree
+    captures = _captures(nodes)
+    converters = getattr(parser, 'converters', None) or {}
+    typed = tuple((node[1], node[2]) for node in captures
+                  if node[2] in converters)
+    return literals, _features(nodes, openended, parser.patterns), typed
+
+
+def _groups(mapping, match):
+    """Return the groupdict of a mapping's match, with values converted.
+
+    Returns None if a converter raises ValueError, so the mapping can be
+    treated as not matching.
+    """
+    svars = match.groupdict()
+    converters = getattr(mapping, 'converters', None)
+    if converters:
+        try:
+            for name, convert in converters:
+                value = svars.get(name)
+                if value is not None:
+                    svars[name] = convert(value)
+        except ValueError:
+            return None
+    return svars
+
+
+def _arg_values(mapping, match):
+    """Return a match's routing arg values, as `_groups` does for lean args.
+
+    The values are in `_layout` order and taken by group number. Returns
+    None if a converter raises ValueError.
+    """
+    numbers, names, labels, converters = _layout_of(mapping)
+    groups = getattr(match, 'groups', None)
+    if groups is None:
+        values = [match.group(name) for name in names]
+    else:
+        groups = groups()
+        values = [groups[number - 1] for number in numbers]
+    if converters:
+        try:
+            for position, convert in converters:
+                if values[position] is not None:
+                    values[position] = convert(values[position])
+        except ValueError:
+            return None
+    return values
+
+
+class Mapping(tuple):
+    """A ``(compiled_regex, method_dict)`` pair as made by `Selector.add`.
+
+    It unpacks just like a plain pair. It also remembers the path
+    expression and parser it came from, and knows which exact paths, if
+    any, are the only ones its regex can match, some cheap facts
+    about the paths it can match (see `PruningMatcher`), the converters
+    for its captures and, in `layout`, the group numbers lean routing
+    args are taken from (see `_layout`). See `_facts`; the rest
+    are worked out from the parse `tree` of the expression (see
+    `_parse`) unless `facts` is given. The tree is kept for the matchers
+    and such to use (see `_tree`).
+    """
+
+    def __new__(cls, regex, method_dict, expression=None, parser=None,
+                facts=None, tree=None):
+        """Make the pair and look for exact paths."""
+        mapping = tuple.__new__(cls, (regex, method_dict))
+        mapping.expression = expression
+        mapping.parser = parser
+        if facts is None:
+            if tree is None:
+                tree = _parse(parser, expression)
+            facts = _facts(regex, parser, tree)
+        elif tree is None:
+            # Parsed only if asked for.
+            tree = False
+        mapping.tree = tree
+        mapping.facts = facts
+        mapping.literals, mapping.features, typed = facts
+        mapping.converters = tuple((name, parser.converters[type_name])
+                                   for name, type_name in typed)
+        groupindex = None
+        if not isinstance(regex, _DeferredRegex):
+            groupindex = getattr(regex, 'groupindex', None)
+        # Otherwise worked out when first used (see `_layout_of`).
+        mapping.layout = None if groupindex is None else \
+            _layout(groupindex, mapping.converters)
+        return mapping
+
+
+class AllowedMethods(tuple):
+    """A tuple of HTTP methods that carries its ``Allow`` header value."""
+
+    def __new__(cls, methods):
+        """Make the tuple and join up the header."""
+        allowed = tuple.__new__(cls, methods)
+        allowed.header = ', '.join(allowed)
+        return allowed
+
+
+class Route(object):
+    """A frozen mapping, with what dispatch needs worked out up front.
+
+    Routes make up a `RouteTable`. A route unpacks and indexes like a
+    ``(compiled_regex, method_dict)`` pair so matchers can use it.
+    """
+
+    __slots__ = ('regex', 'methods', 'allowed', 'allow', 'any',
+                 'expression', 'parser', 'literals', 'features',
+                 'converters', 'layout', 'tree')
+
+    def __init__(self, mapping):
+        """Freeze a mapping (a `Mapping` or plain pair)."""
+        regex, methods = mapping
+        self.regex = regex
+        self.methods = dict(methods)
+        for meth, app in self.methods.items():
+            # Unresolved proxies must also replace themselves in here.
+            if isinstance(app, LazyHandler):
+                if app.target is None:
+                    app.slots.append((self.methods, meth))
+                else:
+                    self.methods[meth] = app.target
+        self.allowed = AllowedMethods(self.methods)
+        self.allow = self.allowed.header
+        self.any = '_ANY_' in self.methods
+        for name in ('expression', 'parser', 'literals', 'features',
+                     'converters', 'layout', 'tree'):
+            setattr(self, name, getattr(mapping, name, None))
+
+    def __len__(self):
+        """Two, like a pair."""
+        return 2
+
+    def __getitem__(self, index):
+        """Return the regex for 0 and the method dict for 1."""
+        if index in (0, -2):
+            return self.regex
+        if index in (1, -1):
+            return self.methods
+        raise IndexError(index)
+
+    def __iter__(self):
+        """Unpack like a ``(compiled_regex, method_dict)`` pair."""
+        yield self.regex
+        yield self.methods
+
+    def __repr__(self):
+        """Show the source of the route."""
+        return '<Route %s %s>' % (self.expression or self.regex.pattern,
+                                  self.allow)
+
+
+class RouteTable(tuple):
+    """A read-only sequence of `Route` objects. See `Selector.freeze`."""
+
+    def __new__(cls, mappings):
+        """Freeze each of the mappings that isn't a `Route` already."""
+        return tuple.__new__(cls, (m if isinstance(m, Route) else Route(m)
+                                   for m in mappings))
+
+    def append(self, mapping):
+        """Refuse to add routes."""
+        raise TypeError("Route table is frozen; can't add %r" % (mapping,))
+
+
+class LinearMatcher(object):
+    """Find the mappings whose regexes match a path, one regex at a time.
+
+    This is the default matcher. A matcher is built from a list of
+    ``(compiled_regex, method_dict)`` mappings and its `matches` method
+    yields ``(index, match)`` for each mapping that matches the path,
+    in table order.
+
+    Mappings that can only match a few exact paths (see `Mapping`) are
+    kept in a dict keyed by path instead of being scanned. Looking a path
+    up there gives the literal mappings to try, which are put in among
+    the rest by index, so an earlier regex still wins.
+    """
+
+    def __init__(self, mappings):
+        """Build the matcher for `mappings`."""
+        self.mappings = mappings
+        self.exact = {}
+        self.lengths = set()
+        self.dynamic = []
+        self.at = {}
+        self.entries = entries = []
+        self.dynamic_entries = []
+        self.exact_entries = {}
+        for index, mapping in enumerate(mappings):
+            entries.append((index, mapping[0], mapping,
+                            getattr(mapping, 'converters', None)))
+            literals = getattr(mapping, 'literals', None)
+            if literals is None:
+                self.dynamic.append(index)
+                self.dynamic_entries.append(entries[-1])
+            else:
+                for literal in literals:
+                    self.exact.setdefault(literal, []).append(index)
+                    cuts, found = self.exact_entries.setdefault(
+                        literal, ([], []))
+                    cuts.append(len(self.dynamic))
+                    found.append(entries[-1])
+                    self.lengths.add(len(literal))
+
+    def candidates(self, path):
+        """Return the indexes of the mappings to try for path, in order."""
+        if path.endswith('\n'):
+            # `$` also matches before a trailing newline; try everything.
+            return range(len(self.mappings))
+        found = self.exact.get(path)
+        if found is None:
+            return self.dynamic
+        return self._splice(self.dynamic, self.exact_entries[path][0], found)
+
+    def candidate_entries(self, path):
+        """Return `candidates` as entries for `Selector.select`.
+
+        They are ``(index, regex, mapping, converters)`` tuples.
+        """
+        if path.endswith('\n'):
+            return self.entries
+        found = self.exact_entries.get(path)
+        if found is None:
+            return self.dynamic_entries
+        cuts, items = found
+        if cuts[-1]:
+            return self._splice(self.dynamic_entries, cuts, items)
+        # They all come before the mappings that are scanned.
+        return chain(items, self.dynamic_entries)
+
+    @staticmethod
+    def _splice(dynamic, cuts, items):
+        """Put items into dynamic, each after as many as its cut says.
+
+        `dynamic` is `dynamic` or a list that goes with it, like
+        `dynamic_entries`. The cuts, how many dynamic mappings come
+        before each literal one, are worked out with the table, and the
+        rest is only sliced lazily, so a hit on an exact path costs no
+        more than the regexes tried before it.
+        """
+        if not dynamic:
+            return items
+        if len(cuts) == 1:
+            cut = cuts[0]
+            if not cut:
+                return chain(items, dynamic)
+            return chain(islice(dynamic, cut), items,
+                         islice(dynamic, cut, None))
+        pieces = []
+        start = 0
+        for cut, item in zip(cuts, items):
+            pieces.append(islice(dynamic, start, cut))
+            pieces.append((item,))
+            start = cut
+        pieces.append(islice(dynamic, start, None))
+        return chain.from_iterable(pieces)
+
+    def matches(self, path):
+        """Yield ``(index, match)`` for each mapping matching path."""
+        mappings = self.mappings
+        for index in self.candidates(path):
+            match = mappings[index][0].search(path)
+            if match:
+                yield index, match
+
+    def matches_at(self, path, pos):
+        """Yield what ``matches(path[pos:])`` would, without the slice.
+
+        Anchored regexes are run as ``match(path, pos)`` without their
+        ``^`` (see `_unanchored`); others still get the rest of the path
+        as a string of its own. So does the lookup of exact paths, but
+        only if the rest is as long as one of them.
+        """
+        mappings = self.mappings
+        at = self.at
+        if path.endswith('\n'):
+            candidates = range(len(mappings))
+        elif len(path) - pos in self.lengths and path[pos:] in self.exact:
+            rest = path[pos:]
+            candidates = self._splice(self.dynamic,
+                                      self.exact_entries[rest][0],
+                                      self.exact[rest])
+        else:
+            candidates = self.dynamic
+        for index in candidates:
+            match_at = at.get(index) or self._match_at(index)
+            match = match_at(path, pos)
+            if match:
+                yield index, match
+
+    def _match_at(self, index):
+        """Return a ``(path, pos)`` function matching mapping index at pos.
+
+        They are kept in `at`, by index.
+        """
+        regex = _unanchored(self.mappings[index][0])
+        if regex is None:
+            search = self.mappings[index][0].search
+
+            def match_at(path, pos):
+                return search(path[pos:])
+        else:
+            match_at = regex.match
+        self.at[index] = match_at
+        return match_at
+
+
+class CombinedMatcher(LinearMatcher):
+    """Find the first matching mapping with one alternation of regexes.
+
+    Runs of anchored regexes are joined into a single
+    ``(?P<_0>...)|(?P<_1>...)|...`` pattern, so the first match costs one
+    pass of the regex engine rather than one call per mapping.
+    Alternation tries its branches in order, so the winner is the same
+    mapping a linear scan would find. If the caller keeps asking (because
+    that mapping lacked the HTTP method), the rest of the run is scanned
+    one regex at a time.
+
+    Regexes that are not anchored or that use backreferences are left
+    out of the alternation and tried on their own, in order. The
+    alternation leaves out their ``^`` so it can also match from an
+    offset (see `LinearMatcher.matches_at`).
+    """
+
+    #: Groups per alternation. Older versions of `re` allow only 100.
+    max_groups = 99
+
+    def __init__(self, mappings):
+        """Build the alternations for `mappings`."""
+        LinearMatcher.__init__(self, mappings)
+        self.chunks = []
+        run, groups = [], 0
+        for index, (regex, method_dict) in enumerate(mappings):
+            pattern = getattr(regex, 'pattern', None)
+            if pattern is not None and _anchored(pattern):
+                pattern = _ungrouped(pattern[1:])
+            else:
+                pattern = None
+            if pattern is None or groups + regex.groups + 1 > self.max_groups:
+                self._add_chunk(run)
+                run, groups = [], 0
+            if pattern is None:
+                self.chunks.append((None, (), index, index + 1))
+            else:
+                run.append((index, pattern))
+                groups += regex.groups + 1
+        self._add_chunk(run)
+
+    def _add_chunk(self, run):
+        """Compile an alternation for a run of ``(index, pattern)``."""
+        if not run:
+            return
+        combined = re.compile('|'.join('(?P<_%s>%s)' % item for item in run))
+        winners = [None] * (combined.groups + 1)
+        for index, pattern in run:
+            winners[combined.groupindex['_%s' % index]] = index
+        self.chunks.append((combined, winners, run[0][0], run[-1][0] + 1))
+
+    def matches(self, path):
+        """Yield ``(index, match)`` for each mapping matching path."""
+        mappings = self.mappings
+        for combined, winners, start, stop in self.chunks:
+            if combined is not None:
+                found = combined.match(path)
+                if found is None:
+                    continue
+                start = winners[found.lastindex]
+            for index in range(start, stop):
+                match = mappings[index][0].search(path)
+                if match:
+                    yield index, match
+
+    def matches_at(self, path, pos):
+        """Yield what ``matches(path[pos:])`` would, without the slice."""
+        at = self.at
+        for combined, winners, start, stop in self.chunks:
+            if combined is not None:
+                found = combined.match(path, pos)
+                if found is None:
+                    continue
+                start = winners[found.lastindex]
+            for index in range(start, stop):
+                match_at = at.get(index) or self._match_at(index)
+                match = match_at(path, pos)
+                if match:
+                    yield index, match
+
+
+def _expand_optionals(nodes, limit=64):
+    """Expand a `SimpleParser.parse` tree into lists without optionals.
+
+    Raises ValueError if there would be more than `limit` of them.
+    """
+    variants = [[]]
+    for node in nodes:
+        if node[0] == 'optional':
+            options = [[]] + _expand_optionals(node[1], limit)
+        else:
+            options = [[node]]
+        variants = [v + o for v in variants for o in options]
+        if len(variants) > limit:
+            raise ValueError(nodes)
+    return variants
+
+
+def _segments(mapping, segment_patterns=_segment_patterns):
+    """Return the lists of path segments a mapping can match, or None.
+
+    Each segment is a list of literal strings and 1-tuples holding the
+    regex of a capture. Gives None for mappings that don't come from a
+    parser with ``parse``, open ended expressions, and expressions with
+    a capture type not in `segment_patterns`.
+    """
+    tree = _tree(mapping)
+    if tree is None or tree[1]:
+        return None
+    nodes = tree[0]
+    parser = mapping.parser
+    try:
+        variants = _expand_optionals(nodes)
+    except ValueError:
+        return None
+    results = []
+    for variant in variants:
+        segments = [[]]
+        for node in variant:
+            if node[0] == 'literal':
+                pieces = node[1].split('/')
+                segments[-1].append(pieces[0])
+                segments.extend([piece] for piece in pieces[1:])
+            else:
+                pattern = parser.patterns.get(node[2])
+                if pattern not in segment_patterns:
+                    return None
+                segments[-1].append(('(?:%s)' % pattern,))
+        results.append(segments)
+    return results
+
+
+def _signature(mapping):
+    """Sum up the paths a mapping can match, for `_disjoint`.
+
+    Returns a list with a tuple per variant, holding a string for each
+    literal path segment and None for each segment with a capture, or
+    None if the mapping can't be summed up. It is kept on `Mapping`
+    objects, as working it out takes a parse.
+    """
+    signature = getattr(mapping, 'signature', False)
+    if signature is False:
+        signature = _sum_up(mapping)
+        if isinstance(mapping, Mapping):
+            mapping.signature = signature
+    return signature
+
+
+def _sum_up(mapping):
+    """Work out the `_signature` of a mapping."""
+    variants = _segments(mapping)
+    if variants is None:
+        literals = getattr(mapping, 'literals', None)
+        if literals is None:
+            return None
+        variants = [[[piece] for piece in literal.split('/')]
+                    for literal in literals]
+    signature = []
+    for segments in variants:
+        summary = []
+        for segment in segments:
+            if any(isinstance(bit, tuple) for bit in segment):
+                summary.append(None)
+            else:
+                text = ''.join(segment)
+                # `$` also matches before a trailing newline.
+                summary.append(None if '\n' in text else text)
+        signature.append(tuple(summary))
+    return signature
+
+
+def _disjoint(a, b):
+    """Tell whether no path can match both of two signatures."""
+    if a is None or b is None:
+        return False
+    for x in a:
+        for y in b:
+            if len(x) != len(y):
+                continue
+            for p, q in zip(x, y):
+                if p is not None and q is not None and p != q:
+                    break
+            else:
+                return False
+    return True
+
+
+class _Overlaps(object):
+    """Find the signatures, of those added so far, that may share a path.
+
+    Signatures (see `_signature`) are added with a number. Each variant
+    is kept under its number of segments and, for each segment, under
+    its literal or as a capture. A lookup only checks the variants that
+    agree with it on the segment where that leaves the fewest to check.
+    """
+
+    def __init__(self):
+        """Start with no signatures."""
+        self.numbers = []
+        self.wild = []
+        self.signatures = {}
+        self.lengths = {}
+
+    def add(self, number, signature):
+        """Add signature, as number."""
+        self.numbers.append(number)
+        if signature is None:
+            self.wild.append(number)
+            return
+        self.signatures[number] = signature
+        for variant in signature:
+            columns = self.lengths.get(len(variant))
+            if columns is None:
+                columns = self.lengths[len(variant)] = (
+                    [], [({}, []) for segment in variant])
+            columns[0].append(number)
+            for (literals, captures), segment in zip(columns[1], variant):
+                if segment is None:
+                    captures.append(number)
+                else:
+                    literals.setdefault(segment, []).append(number)
+
+    def overlapping(self, signature):
+        """Return the set of numbers whose signatures aren't `_disjoint`."""
+        if signature is None:
+            return set(self.numbers)
+        found = set(self.wild)
+        for variant in signature:
+            columns = self.lengths.get(len(variant))
+            if columns is None:
+                continue
+            fewest = (columns[0],)
+            for (literals, captures), segment in zip(columns[1], variant):
+                if segment is not None:
+                    agree = (literals.get(segment, ()), captures)
+                    if len(agree[0]) + len(agree[1]) < sum(map(len, fewest)):
+                        fewest = agree
+            for numbers in fewest:
+                for number in numbers:
+                    if number not in found and not _disjoint(
+                            [variant], self.signatures[number]):
+                        found.add(number)
+        return found
+
+
+_not_unicode = ~int(re.UNICODE)
+
+
+def _regex_key(regex):
+    """Return what makes two compiled regexes match the same paths.
+
+    ``re.UNICODE`` is left out, as Python 3 adds it to text patterns.
+    """
+    return (getattr(regex, 'pattern', regex),
+            getattr(regex, 'flags', 0) & _not_unicode)
+
+
+def _route_key(mapping):
+    """Name a mapping by its HTTP methods and regex, for hit profiles."""
+    regex, method_dict = mapping
+    return '%s %s' % (','.join(sorted(method_dict)),
+                      getattr(regex, 'pattern', regex))
+
+
+class _TrieNode(object):
+    """One path segment deep in a `TrieMatcher`."""
+
+    __slots__ = ('literals', 'patterns', 'routes')
+
+    def __init__(self):
+        """Make an empty node."""
+        self.literals = {}
+        self.patterns = []
+        self.routes = []
+
+
+class TrieMatcher(LinearMatcher):
+    """Find matching mappings by walking a trie of path segments.
+
+    Path expressions are taken apart with their parser's ``parse`` method
+    (see `SimpleParser.parse`) and split on ``/``. Segments with nothing
+    variable in them become dict keys in the trie; segments with
+    captures are kept as small regexes tried only at that branch. A
+    lookup splits the path the same way and walks down, so the cost
+    depends on how deep the path is rather than on how many routes
+    there are. The regexes of the mappings found are then run in table
+    order to get the match itself.
+
+    Mappings that can't go in the trie are scanned in order along with
+    the ones found: plain regexes, open ended (``|``) expressions, and
+    expressions with a type that may match a ``/`` (like ``any``).
+    """
+
+    #: Type patterns that never match a ``/``.
+    segment_patterns = _segment_patterns
+    #: Paths are split, so the rest of one is copied (see `_matches`).
+    matches_at = None
+
+    def __init__(self, mappings):
+        """Build the trie for `mappings`."""
+        self.mappings = mappings
+        self.root = _TrieNode()
+        self.fallback = []
+        for index, mapping in enumerate(mappings):
+            variants = _segments(mapping, self.segment_patterns)
+            if variants is None:
+                self.fallback.append(index)
+                continue
+            for segments in variants:
+                node = self.root
+                for segment in segments:
+                    node = self._child(node, segment)
+                if index not in node.routes:
+                    node.routes.append(index)
+
+    def _child(self, node, segment):
+        """Return (making it if need be) the child of node for segment.
+
+        `segment` is a list of literal strings and 1-tuples holding the
+        regex of a capture.
+        """
+        if all(not isinstance(bit, tuple) for bit in segment):
+            return node.literals.setdefault(''.join(segment), _TrieNode())
+        regex = ''.join(bit[0] if isinstance(bit, tuple) else re.escape(bit)
+                        for bit in segment) + r'\Z'
+        for pattern, child in node.patterns:
+            if pattern.pattern == regex:
+                return child
+        child = _TrieNode()
+        node.patterns.append((re.compile(regex), child))
+        return child
+
+    def _found(self, path):
+        """Return the sorted indexes of trie mappings matching path."""
+        segments = path.split('/')
+        depth = len(segments)
+        found = set()
+        stack = [(self.root, 0)]
+        while stack:
+            node, i = stack.pop()
+            if i == depth:
+                found.update(node.routes)
+                continue
+            segment = segments[i]
+            child = node.literals.get(segment)
+            if child is not None:
+                stack.append((child, i + 1))
+            for pattern, child in node.patterns:
+                if pattern.match(segment):
+                    stack.append((child, i + 1))
+        return sorted(found)
+
+    def matches(self, path):
+        """Yield ``(index, match)`` for each mapping matching path."""
+        mappings = self.mappings
+        if path.endswith('\n'):
+            # `$` also matches before a trailing newline; try everything.
+            candidates = range(len(mappings))
+        else:
+            candidates = merge(self._found(path), self.fallback)
+        for index in candidates:
+            match = mappings[index][0].search(path)
+            if match:
+                yield index, match
+
+
+class PruningMatcher(LinearMatcher):
+    """Skip mappings that can't match a path before trying their regexes.
+
+    Uses the facts each `Mapping` works out from its path expression: the
+    literal prefix and suffix, the least length and the least and most
+    number of ``/``. Mappings whose prefix goes past the first path
+    segment (like ``/api/...``) are also grouped by that segment, so
+    whole groups are skipped with one dict lookup. Mappings without those
+    facts, such as plain regexes, are always tried.
+    """
+
+    #: Paths are matched from the start (see `_matches`).
+    matches_at = None
+
+    def __init__(self, mappings):
+        """Group `mappings` by first path segment."""
+        self.mappings = mappings
+        self.features = []
+        self.heads = {}
+        self.general = []
+        for index, mapping in enumerate(mappings):
+            features = getattr(mapping, 'features', None)
+            self.features.append(features)
+            head = features and _head(features[0])
+            if head is None:
+                self.general.append(index)
+            else:
+                self.heads.setdefault(head, []).append(index)
+
+    def matches(self, path):
+        """Yield ``(index, match)`` for each mapping matching path."""
+        mappings = self.mappings
+        if path.endswith('\n'):
+            # `$` also matches before a trailing newline; try everything.
+            for index, (regex, method_dict) in enumerate(mappings):
+                match = regex.search(path)
+                if match:
+                    yield index, match
+            return
+        group = self.heads.get(_head(path))
+        if group is None:
+            candidates = self.general
+        else:
+            candidates = merge(self.general, group)
+        length = len(path)
+        slashes = path.count('/')
+        features = self.features
+        for index in candidates:
+            facts = features[index]
+            if facts is not None:
+                prefix, least, most, shortest, suffix = facts
+                if (length < shortest or slashes < least or
+                        (most is not None and slashes > most) or
+                        not path.startswith(prefix) or
+                        not path.endswith(suffix)):
+                    continue
+            match = mappings[index][0].search(path)
+            if match:
+                yield index, match
+
+
+_class_tests = {}
+
+
+def _class_test(atom):
+    """Return a memoized one-character test for regex `atom`.
+
+    The test is a ``(memo, regex)`` pair; see `_accepts`.
+    """
+    test = _class_tests.get(atom)
+    if test is None:
+        test = _class_tests[atom] = ({}, re.compile(atom))
+    return test
+
+
+def _accepts(op, char):
+    """Tell whether instruction `op` consumes char."""
+    kind = op[0]
+    if kind == 'char':
+        return op[1] == char
+    if kind != 'class':
+        return False
+    memo = op[1]
+    ok = memo.get(char)
+    if ok is None:
+        ok = op[2].match(char) is not None
+        if len(memo) < 4096:
+            memo[char] = ok
+    return ok
+
+
+def _atoms(pattern):
+    """Split a type pattern into ``(atom, quantifier)`` pairs.
+
+    Handles sequences of single characters, escapes, ``.`` and
+    character classes, each with an optional ``*``, ``+`` or ``?``,
+    which covers the `SimpleParser` types. Raises ValueError for
+    anything else.
+    """
+    atoms = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '\\':
+            atom = pattern[i:i + 2]
+            if len(atom) < 2 or (atom[1].isalnum() and
+                                 atom[1] not in 'dDsSwW'):
+                raise ValueError(pattern)
+            i += 2
+        elif c == '[':
+            end = i + 1
+            if pattern[end:end + 1] == '^':
+                end += 1
+            if pattern[end:end + 1] == ']':
+                end += 1
+            while end < n and pattern[end] != ']':
+                if pattern[end] == '\\':
+                    end += 1
+                end += 1
+            if end >= n:
+                raise ValueError(pattern)
+            atom = pattern[i:end + 1]
+            i = end + 1
+        elif c in '()|^$*+?{}':
+            raise ValueError(pattern)
+        else:
+            atom = c
+            i += 1
+        quantifier = pattern[i:i + 1]
+        if quantifier in ('*', '+', '?'):
+            i += 1
+            if pattern[i:i + 1] in ('*', '+', '?', '{'):
+                raise ValueError(pattern)
+        elif quantifier == '{':
+            raise ValueError(pattern)
+        else:
+            quantifier = ''
+        atoms.append((atom, quantifier))
+    return atoms
+
+
+def _render(nodes, patterns):
+    """Return the regex `SimpleParser` makes for parse tree nodes."""
+    parts = []
+    for node in nodes:
+        if node[0] == 'literal':
+            parts.append(re.escape(node[1]))
+        elif node[0] == 'capture':
+            parts.append('(?P<%s>%s)' % (node[1], patterns[node[2]]))
+        else:
+            parts.append('(%s)?' % _render(node[1], patterns))
+    return ''.join(parts)
+
+
+def _emit(nodes, patterns, program, names):
+    """Append the instructions for parse tree nodes to `program`."""
+    for node in nodes:
+        if node[0] == 'literal':
+            program.extend(('char', c) for c in node[1])
+        elif node[0] == 'capture':
+            slot = len(names)
+            names.append(node[1])
+            program.append(('save', 2 * slot))
+            for atom, quantifier in _atoms(patterns[node[2]]):
+                if len(atom) == 1 and atom != '.':
+                    test = ('char', atom)
+                else:
+                    test = ('class',) + _class_test(atom)
+                here = len(program)
+                if quantifier == '+':
+                    program.extend([test, ('split', here, here + 2)])
+                elif quantifier == '*':
+                    program.extend([('split', here + 1, here + 3), test,
+                                    ('jump', here)])
+                elif quantifier == '?':
+                    program.extend([('split', here + 1, here + 2), test])
+                else:
+                    program.append(test)
+            program.append(('save', 2 * slot + 1))
+        else:
+            split = len(program)
+            program.append(None)
+            _emit(node[1], patterns, program, names)
+            program[split] = ('split', split + 1, len(program))
+
+
+def _program(mapping):
+    """Compile a mapping's path expression for `DfaMatcher`.
+
+    Returns ``(program, group_names)``, or None if the mapping has no
+    parse tree or its regex isn't made of plain character classes. The
+    program is a list of instructions: ``('char', c)``, ``('class',
+    memo, regex)``, ``('split', first, second)``, ``('jump', to)``,
+    ``('save', slot)``, ``('end',)`` for ``$`` and ``('match',)``.
+    """
+    tree = _tree(mapping)
+    pattern = getattr(mapping[0], 'pattern', None)
+    if tree is None or pattern is None:
+        return None
+    nodes, openended = tree
+    parser = mapping.parser
+    try:
+        rendered = _render(nodes, parser.patterns)
+        if pattern != ('^%s' if openended else '^%s$') % rendered:
+            return None
+        program, names = [], []
+        _emit(nodes, parser.patterns, program, names)
+    except (KeyError, ValueError, PathExpressionParserError):
+        return None
+    if not openended:
+        program.append(('end',))
+    program.append(('match',))
+    return program, names
+
+
+def _pike(program, names, path):
+    """Run a program over path like `re` would, in linear time.
+
+    Threads are kept in priority order, so the match found is the one a
+    backtracking engine would find. Returns a `DfaMatch` or None.
+    """
+    n = len(path)
+    found = None
+
+    def add(threads, seen, pc, saved, pos):
+        if pc in seen:
+            return
+        seen.add(pc)
+        op = program[pc]
+        kind = op[0]
+        if kind == 'jump':
+            add(threads, seen, op[1], saved, pos)
+        elif kind == 'split':
+            add(threads, seen, op[1], saved, pos)
+            add(threads, seen, op[2], saved, pos)
+        elif kind == 'save':
+            saved = list(saved)
+            saved[op[1]] = pos
+            add(threads, seen, pc + 1, saved, pos)
+        elif kind == 'end':
+            if pos == n or (pos == n - 1 and path[pos] == '\n'):
+                add(threads, seen, pc + 1, saved, pos)
+        else:
+            threads.append((op, pc, saved))
+
+    threads = []
+    add(threads, set(), 0, [None] * (2 * len(names)), 0)
+    for pos in range(n + 1):
+        char = path[pos:pos + 1]
+        following, seen = [], set()
+        for op, pc, saved in threads:
+            if op[0] == 'match':
+                found = saved, pos
+                break
+            if char and _accepts(op, char):
+                add(following, seen, pc + 1, saved, pos + 1)
+        threads = following
+        if not threads:
+            break
+    if found is None:
+        return None
+    return DfaMatch(path, names, found[0], found[1])
+
+
+class DfaMatch(object):
+    """The bits of a regex match object that `Selector` uses."""
+
+    __slots__ = ('string', 'names', 'saved', 'end')
+
+    def __init__(self, string, names, saved, end):
+        """Hold the group spans found by `DfaMatcher`."""
+        self.string = string
+        self.names = names
+        self.saved = saved
+        self.end = end
+
+    def group(self, name=0):
+        """Return the text matched by the whole match or a named group."""
+        if name == 0:
+            return self.string[:self.end]
+        slot = 2 * self.names.index(name)
+        start, end = self.saved[slot], self.saved[slot + 1]
+        if start is None or end is None:
+            return None
+        return self.string[start:end]
+
+    def groupdict(self):
+        """Return a dict of named groups, like a regex match."""
+        return dict((name, self.group(name)) for name in self.names)
+
+
+class _DfaState(object):
+    """A set of ``(mapping_index, pc)`` threads and where chars lead."""
+
+    __slots__ = ('threads', 'next', 'accepts', 'ends')
+
+    def __init__(self, threads, programs):
+        """Note which mappings have matched or may match at the end."""
+        self.threads = threads
+        self.next = {}
+        self.accepts = []
+        self.ends = []
+        for index, pc in threads:
+            kind = programs[index][pc][0]
+            if kind == 'match':
+                self.accepts.append(index)
+                self.ends.append(index)
+            elif kind == 'end':
+                self.ends.append(index)
+
+
+class DfaMatcher(LinearMatcher):
+    """Find matching mappings with a DFA, in time linear in the path.
+
+    Each mapping made by a `SimpleParser` whose types are plain
+    character classes (all the built-in ones are) is compiled to a small
+    program. The programs of the whole table run together as a DFA,
+    built lazily one state per new set of positions, so a path is read
+    once whatever it holds, and no regex ever backtracks. Groups are
+    then filled in for the mappings asked for by running just their own
+    program, still in linear time. Other mappings, such as plain
+    regexes, are tried with `re` as usual.
+
+    At most `max_states` states are kept; past that they are dropped and
+    built again as needed.
+    """
+
+    max_states = 4096
+    #: Paths are matched from the start (see `_matches`).
+    matches_at = None
+
+    def __init__(self, mappings):
+        """Compile programs for `mappings`."""
+        self.mappings = mappings
+        self.programs = {}
+        self.names = {}
+        self.fallback = []
+        for index, mapping in enumerate(mappings):
+            compiled = _program(mapping)
+            if compiled is None:
+                self.fallback.append(index)
+            else:
+                self.programs[index], self.names[index] = compiled
+        self.states = {}
+        self.flushes = 0
+        self.start = self._state(self._closure(
+            (index, 0) for index in self.programs))
+
+    def _closure(self, threads):
+        """Follow jumps, splits and saves from threads."""
+        programs = self.programs
+        stack = list(threads)
+        seen = set()
+        while stack:
+            thread = stack.pop()
+            if thread in seen:
+                continue
+            seen.add(thread)
+            index, pc = thread
+            op = programs[index][pc]
+            if op[0] == 'jump':
+                stack.append((index, op[1]))
+            elif op[0] == 'split':
+                stack.append((index, op[1]))
+                stack.append((index, op[2]))
+            elif op[0] == 'save':
+                stack.append((index, pc + 1))
+        return frozenset(thread for thread in seen
+                         if programs[thread[0]][thread[1]][0] not in
+                         ('jump', 'split', 'save'))
+
+    def _state(self, threads):
+        """Return the state for a set of threads, making it if need be."""
+        state = self.states.get(threads)
+        if state is None:
+            if len(self.states) >= self.max_states:
+                self.flushes += 1
+                start = _DfaState(self.start.threads, self.programs)
+                self.states = {start.threads: start}
+                self.start = start
+            state = self.states.get(threads)
+        if state is None:
+            state = self.states[threads] = _DfaState(threads, self.programs)
+        return state
+
+    def _step(self, state, char):
+        """Work out and remember the state char leads to from state."""
+        programs = self.programs
+        moved = [(index, pc + 1) for index, pc in state.threads
+                 if _accepts(programs[index][pc], char)]
+        following = self._state(self._closure(moved))
+        state.next[char] = following
+        return following
+
+    def _recognize(self, path):
+        """Return the indexes of the compiled mappings matching path."""
+        state = self.start
+        found = set(state.accepts)
+        last = len(path) - 1
+        for pos, char in enumerate(path):
+            if pos == last and char == '\n':
+                # `$` also matches before a trailing newline.
+                found.update(state.ends)
+            following = state.next.get(char)
+            if following is None:
+                following = self._step(state, char)
+            state = following
+            if not state.threads:
+                break
+            if state.accepts:
+                found.update(state.accepts)
+        else:
+            found.update(state.ends)
+        return found
+
+    def matches(self, path):
+        """Yield ``(index, match)`` for each mapping matching path."""
+        mappings = self.mappings
+        programs = self.programs
+        for index in merge(sorted(self._recognize(path)), self.fallback):
+            if index in programs:
+                match = _pike(programs[index], self.names[index], path)
+            else:
+                match = mappings[index][0].search(path)
+            if match:
+                yield index, match
+
+
+def _prefix_candidates(paths, prefixes):
+    """Return, for each path, the sorted indexes of the mappings to try.
+
+    `prefixes` maps literal prefixes to lists of mapping indexes; a path
+    gets the indexes of every prefix it starts with. Uses NumPy to test
+    the whole batch against each prefix at once if it is installed.
+    """
+    candidates = [[] for path in paths]
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if numpy is not None and paths:
+        array = numpy.array(paths)
+        for prefix, indexes in prefixes.items():
+            hits = numpy.flatnonzero(numpy.char.startswith(array, prefix))
+            for i in hits:
+                candidates[i].extend(indexes)
+    else:
+        for prefix, indexes in prefixes.items():
+            for i, path in enumerate(paths):
+                if path.startswith(prefix):
+                    candidates[i].extend(indexes)
+    for indexes in candidates:
+        indexes.sort()
+    return candidates
+
+
+class LRUCache(object):
+    """A bounded mapping that forgets the least recently used keys.
+
+    Counts its hits, misses and evictions so it can be sized.
+    """
+
+    def __init__(self, maxsize):
+        """Hold at most `maxsize` items."""
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        """Return the number of items held."""
+        return len(self.data)
+
+    def get(self, key):
+        """Return the value for key, or None."""
+        try:
+            value = self.data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.data[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Hold value for key, evicting the oldest item if full."""
+        data = self.data
+        data[key] = value
+        while len(data) > self.maxsize:
+            try:
+                data.popitem(last=False)
+            except KeyError:
+                break
+            self.evictions += 1
+
+    def clear(self):
+        """Forget everything, but keep counting."""
+        self.data.clear()
+
+
+#: Regexes made from path expressions, shared by all selectors; see
+#: `_compile`. Set it to None to turn sharing off.
+compile_cache = LRUCache(4096)
+#: Part of the key of mapping file caches; see `Selector._slurp_cached`.
+mapfile_cache_format = 3
+_source_hash = None
+
+
+def _source_key():
+    """Return a hash of this module's source, for mapping file caches.
+
+    So caches written by another version of selector aren't used. Gives
+    an empty string if the source can't be read.
+    """
+    global _source_hash
+    if _source_hash is None:
+        filename = __file__
+        if filename.endswith(('.pyc', '.pyo')):
+            filename = filename[:-1]
+        try:
+            with open(filename, 'rb') as source:
+                _source_hash = hashlib.sha1(source.read()).hexdigest()
+        except (IOError, OSError):
+            _source_hash = ''
+    return _source_hash
+
+
+def _parser_key(parser):
+    """Return what decides the regexes parser makes, or None.
+
+    That is its ``cache_key()`` and the names of its converters.
+    """
+    cache_key = getattr(parser, 'cache_key', None)
+    key = cache_key and cache_key()
+    if key is None:
+        return None
+    return key, sorted(getattr(parser, 'converters', {}))
+
+
+class _DeferredRegex(object):
+    """A regex that is compiled the first time it's used.
+
+    Made for `Selector.add_many`. It has the `pattern` and `flags` it
+    was made with; asking for anything else compiles it, and what was
+    asked for is kept, so calls to `search` and `match` cost no more
+    than on a compiled regex after the first.
+    """
+
+    def __init__(self, pattern, flags=0):
+        """Hold on to the pattern."""
+        self.pattern = pattern
+        self.flags = flags
+
+    def check(self):
+        """Raise ``re.error``, naming the pattern, if it's no good.
+
+        Only parses the pattern, which is where `re` finds the errors,
+        so compiling is still put off.
+        """
+        if 'compiled' in self.__dict__:
+            return
+        try:
+            _regex_parser.parse(self.pattern, self.flags)
+        except re.error as error:
+            raise re.error('%s in regex %r' % (error, self.pattern))
+
+    def compile(self):
+        """Compile the regex, if not done yet, and return it."""
+        compiled = self.__dict__.get('compiled')
+        if compiled is None:
+            compiled = self.compiled = re.compile(self.pattern, self.flags)
+        return compiled
+
+    def __getattr__(self, name):
+        """Compile and look name up on the compiled regex."""
+        if name.startswith('__'):
+            raise AttributeError(name)
+        value = getattr(self.compile(), name)
+        setattr(self, name, value)
+        return value
+
+    def __repr__(self):
+        """Show the pattern."""
+        return '<deferred regex %r>' % self.pattern
+
+
+def _parses_plainly(parser):
+    """Tell whether calling parser just renders its `SimpleParser.parse`."""
+    call = getattr(type(parser), '__call__', None)
+    return getattr(call, '__func__', call) is _simple_call
+
+
+def _compile(parser, expression, defer=False):
+    """Return the regex string, compiled regex and tree for an expression.
+
+    The tree is the parser's `SimpleParser.parse` of the expression, if
+    the regex was rendered from it, and otherwise None. Answers are kept
+    in `compile_cache`, keyed by the parser's ``cache_key()`` if it has
+    one and otherwise by the parser itself, so selectors using the same
+    expressions share compiled regexes. Parsers whose ``cache_key()``
+    returns None are always called. With `defer`, a regex not compiled
+    yet is made a `_DeferredRegex`, and only the regex string and tree
+    are kept, to be compiled by the next caller without `defer`, so a
+    bad regex still raises when added that way.
+    """
+    cache = compile_cache
+    key = None
+    if cache is not None:
+        cache_key = getattr(parser, 'cache_key', None)
+        key = parser if cache_key is None else cache_key()
+    if key is not None:
+        key = (key, expression)
+        try:
+            hash(key)
+        except TypeError:
+            key = None
+    found = None
+    if key is not None:
+        found = cache.get(key)
+        if found is not None and found[1] is not None:
+            return found
+    if found is not None:
+        regex, compiled, tree = found
+    elif _parses_plainly(parser):
+        tree = parser.parse(expression)
+        regex = parser.from_tree(tree[0], tree[1], expression)
+    else:
+        regex, tree = parser(expression), None
+    if defer:
+        compiled = None
+    else:
+        compiled = re.compile(regex)
+    if key is not None:
+        cache.put(key, (regex, compiled, tree))
+    if defer:
+        return regex, _DeferredRegex(regex), tree
+    return regex, compiled, tree
+
+
+def _url_text(value):
+    """Return value as text to put in a URL."""
+    if isinstance(value, str):
+        return value
+    try:
+        return str(value)
+    except UnicodeEncodeError:
+        return value.encode('utf-8')
+
+
+class UrlTemplate(object):
+    """Build the URLs a path expression matches, for `Selector.url_for`.
+
+    Called with values for the captures, by name or, for ``{}`` captures,
+    in order. Optional parts are put in when values for all their
+    captures are given; optional parts without captures are left out.
+    Values must match their types, and are quoted. For each set of names
+    given, a format string and checks are made once and kept.
+    """
+
+    def __init__(self, nodes, patterns):
+        """Build from `SimpleParser.parse` nodes and type patterns."""
+        self.nodes = nodes
+        self.patterns = patterns
+        self.plans = {}
+
+    def _plan(self, nodes, names, parts, checks):
+        """Add the format for nodes to parts if names has their captures.
+
+        Returns whether it did. The checks for the captures used are
+        added to checks.
+        """
+        added = []
+        for node in nodes:
+            if node[0] == 'literal':
+                added.append(node[1].replace('%', '%%'))
+            elif node[0] == 'capture':
+                if node[1] not in names:
+                    return False
+                added.append('%%(%s)s' % node[1])
+                checks[node[1]] = re.compile(
+                    r'(?:%s)\Z' % self.patterns[node[2]]).match
+            else:
+                # Checks from an optional part left out must not count
+                # its values as used.
+                inner, inner_checks = [], {}
+                if (any(n[0] != 'literal' for n in node[1]) and
+                        self._plan(node[1], names, inner, inner_checks)):
+                    added.extend(inner)
+                    checks.update(inner_checks)
+        parts.extend(added)
+        return True
+
+    def _compile(self, names):
+        """Make and keep the format string and checks for names."""
+        parts, checks = [], {}
+        if not self._plan(self.nodes, names, parts, checks):
+            raise ValueError("Missing values for the URL: %s" % ', '.join(
+                sorted(node[1] for node in _captures(self.nodes)
+                       if node[1] not in names)))
+        unused = names.difference(checks)
+        if unused:
+            raise ValueError("Values not used in the URL: %s" %
+                             ', '.join(sorted(unused)))
+        plan = self.plans[names] = ''.join(parts), checks
+        return plan
+
+    def __call__(self, *args, **values):
+        """Return the URL for the values given."""
+        for pos, value in enumerate(args):
+            values['__pos%s' % pos] = value
+        names = frozenset(values)
+        plan = self.plans.get(names)
+        if plan is None:
+            plan = self._compile(names)
+        template, checks = plan
+        texts = {}
+        for name, value in values.items():
+            text = _url_text(value)
+            if checks[name](text) is None:
+                raise ValueError("Bad value for %s: %r" % (name, value))
+            texts[name] = quote(text)
+        return template % texts
+
+
+def _captures(nodes):
+    """Return the capture nodes in `SimpleParser.parse` nodes."""
+    captures = []
+    for node in nodes:
+        if node[0] == 'capture':
+            captures.append(node)
+        elif node[0] == 'optional':
+            captures.extend(_captures(node[1]))
+    return captures
+
+
+class LazyHandler(object):
+    """A mapping file handler that is only resolved when first called.
+
+    Made by `Selector._handler` for ``lazy_handlers``. When called, the
+    statement is resolved (once per statement, through the shared `memo`
+    dict), wrapped with `wrap` if there is one, and put in place of the
+    proxy in the method dicts noted in `slots`, so later requests go
+    straight to it. Calls made through the proxy are passed on.
+    """
+
+    __slots__ = ('statement', 'resolve', 'memo', 'wrap', 'slots', 'target')
+
+    def __init__(self, statement, resolve, memo):
+        """Hold on to the statement and how to resolve it."""
+        self.statement = statement
+        self.resolve = resolve
+        self.memo = memo
+        self.wrap = None
+        self.slots = []
+        self.target = None
+
+    def resolved(self):
+        """Resolve the handler, if not done yet, and return it."""
+        target = self.target
+        if target is None:
+            memo = self.memo
+            if self.statement in memo:
+                target = memo[self.statement]
+            else:
+                target = memo.setdefault(self.statement,
+                                         self.resolve(self.statement))
+            if self.wrap is not None:
+                target = self.wrap(target)
+            self.target = target
+            for methods, method in self.slots:
+                if methods.get(method) is self:
+                    methods[method] = target
+            self.slots = []
+        return target
+
+    def __call__(self, *args, **kwargs):
+        """Call the handler."""
+        return self.resolved()(*args, **kwargs)
+
+    def __repr__(self):
+        """Show the statement."""
+        return '<LazyHandler %s>' % self.statement
+
+
+class _MappingList(list):
+    """The list of a selector's `mappings`.
+
+    Changing it in place calls the selector's `Selector.invalidate`, so
+    what was built from it is never out of date.
+    """
+
+    __slots__ = ('owner',)
+
+    @classmethod
+    def owned(cls, mappings, owner):
+        """Return mappings as a list owned by owner, if it's a list."""
+        if isinstance(mappings, list):
+            if not isinstance(mappings, cls) or mappings.owner is not owner:
+                mappings = cls(mappings)
+            mappings.owner = owner
+        return mappings
+
+
+def _changes(name):
+    """Make a `_MappingList` method that calls list's, then invalidates."""
+    change = getattr(list, name)
+
+    def method(self, *args, **kwargs):
+        result = change(self, *args, **kwargs)
+        owner = getattr(self, 'owner', None)
+        if owner is not None:
+            owner.invalidate()
+        return result
+    method.__name__ = name
+    method.__doc__ = change.__doc__
+    return method
+
+
+for _name in ('append', 'extend', 'insert', 'remove', 'pop', 'clear',
+              'sort', 'reverse', '__setitem__', '__delitem__', '__iadd__',
+              '__imul__', '__setslice__', '__delslice__'):
+    if hasattr(list, _name):
+        setattr(_MappingList, _name, _changes(_name))
+del _name
+
+
 class Selector(object):
     """WSGI middleware for URL paths and HTTP method based delegation."""
 
     status405 = staticmethod(method_not_allowed)
     status404 = staticmethod(not_found)
+    #: Called with the mappings to build the matcher; see `LinearMatcher`.
+    matcher = LinearMatcher
+    #: Whether `add` merges methods into a mapping with the same regex.
+    merge_methods = True
+    #: Whether `slurp_file` keeps what it read in a cache file.
+    mapfile_cache = False
+    cache = None
+    hits = None
+    by_method = False
+    lazy_handlers = False
+    lean_args = False
+    path_offset = False
+    #: The last error `reload` met in the background, or None.
+    reload_error = None
 
     def __init__(self,
                  mappings=None,
@@ -45,8 +1891,33 @@ class Selector(object):
                  parser=None,
                  wrap=None,
                  mapfile=None,
-                 consume_path=True):
+                 consume_path=True,
+                 matcher=None,
+                 cache_size=None,
+                 record_hits=False,
+                 by_method=False,
+                 lazy_handlers=False,
+                 lean_args=False,
+                 path_offset=False):
         """Initialize selector."""
+        self._matcher = self._linear = None
+        self._regexes = {}
+        self._indexed = 0
+        self._overlaps = None
+        self._pending = None
+        self._watching = None
+        self._handlers = {}
+        self.named = {}
+        self.by_method = by_method
+        self.lazy_handlers = lazy_handlers
+        self.lean_args = lean_args
+        self.path_offset = path_offset
+        if cache_size:
+            self.cache = LRUCache(cache_size)
+        if record_hits:
+            self.hits = Counter()
+        if matcher is not None:
+            self.matcher = matcher
         self.mappings = []
         self.prefix = prefix
         if parser is None:
@@ -54,12 +1925,34 @@ class Selector(object):
         else:
             self.parser = parser
         self.wrap = wrap
+        self.mapfile = mapfile
         if mapfile is not None:
             self.slurp_file(mapfile)
         if mappings is not None:
             self.slurp(mappings)
         self.consume_path = consume_path
 
+    @property
+    def mappings(self):
+        """The list of ``(compiled_regex, method_dict)`` mappings."""
+        return self._mappings
+
+    @mappings.setter
+    def mappings(self, mappings):
+        self._mappings = _MappingList.owned(mappings, self)
+        self.invalidate()
+
+    def invalidate(self):
+        """Forget anything built from the mappings.
+
+        `add` and changes to the `mappings` list take care of this. Call
+        it after changing the matcher, a mapping in place, or the `cache`,
+        `hits` or `lean_args` attributes.
+        """
+        self._matcher = self._linear = None
+        if self.cache is not None:
+            self.cache.clear()
+
     def slurp(self, mappings, prefix=None, parser=None, wrap=None):
         """Slurp in a whole list (or any iterable) of mappings.
 
@@ -87,11 +1980,17 @@ class Selector(object):
         if prefix is not None:
             self.prefix = oldprefix
 
-    def add(self, path, method_dict=None, prefix=None, **http_methods):
+    def add(self, path, method_dict=None, prefix=None, name=None,
+            **http_methods):
         """Add a mapping.
 
         HTTP methods can be specified in a dict or using key word args,
-        but kwargs will override if both are given.
+        but kwargs will override if both are given. Give a `name` to
+        build URLs for the route with `url_for`.
+
+        If an earlier mapping has the very same regex, the methods are
+        merged into it instead (see `_merge`), and that mapping is
+        returned. Within `add_many`, nothing is returned.
         """
         # Thanks to Sebastien Pierre
         # for suggesting that this accept keyword args.
@@ -101,19 +2000,206 @@ class Selector(object):
             prefix = self.prefix
         method_dict = dict(method_dict)
         method_dict.update(http_methods)
+        lazy = [meth for meth, cbl in method_dict.items()
+                if isinstance(cbl, LazyHandler) and cbl.target is None]
         if self.wrap is not None:
             for meth, cbl in list(method_dict.items()):
-                method_dict[meth] = self.wrap(cbl)
-        regex = self.parser(prefix + path)
-        compiled_regex = re.compile(regex)
-        mapping = (compiled_regex, method_dict)
+                if meth in lazy:
+                    cbl.wrap = self.wrap
+                else:
+                    method_dict[meth] = self.wrap(cbl)
+        if self._pending is not None:
+            self._pending.append((prefix + path, method_dict, lazy,
+                                  self.parser, name))
+            return None
+        regex, compiled_regex, tree = _compile(self.parser, prefix + path)
+        if name is not None:
+            self._add_name(name, prefix + path, self.parser, tree)
+        mapping = self._add_mapping(prefix + path, method_dict, lazy,
+                                    self.parser, compiled_regex, tree=tree)
+        self.invalidate()
+        return mapping
+
+    def add_many(self, mappings):
+        """Add mappings from any iterable in one go.
+
+        Each item is the arguments for `add`, as in `slurp`, but the
+        path expressions aren't parsed until the iterable runs out, then
+        each distinct one is parsed once, and the matcher and cache are
+        only reset at the end. Regexes are compiled when first used (see
+        `_DeferredRegex`), so routes that are never tried or that the
+        matcher finds without them cost no compiling. `warmup` compiles
+        the rest. Regexes are still checked at the end, and a bad one
+        raises its ``re.error`` then. If anything goes wrong, none of
+        the mappings are added. Items are
+        taken one at a time, so the iterable can be a generator reading
+        from somewhere. Within another `add_many` (or a bulk
+        `slurp_file`), the mappings just join that one.
+        """
+        if self._pending is not None:
+            for mapping in mappings:
+                self.add(*mapping)
+            return
+        self._pending = pending = []
+        try:
+            for mapping in mappings:
+                self.add(*mapping)
+        finally:
+            self._pending = None
+        self._add_pending(pending)
+
+    def _add_pending(self, pending):
+        """Compile and put in the mappings held back by `add_many`.
+
+        Every path expression is parsed and every regex checked (see
+        `_DeferredRegex.check`) before any mapping is put in, so a bad
+        one leaves the table as it was.
+        """
+        compiled, found = {}, []
+        names = self.named
+        self.named = dict(names)
+        try:
+            for expression, method_dict, lazy, parser, name in pending:
+                key = id(parser), expression
+                regex = compiled.get(key)
+                if regex is None:
+                    regex = compiled[key] = _compile(parser, expression, True)
+                if name is not None:
+                    self._add_name(name, expression, parser, regex[2])
+                found.append(regex)
+            for regex, compiled_regex, tree in compiled.values():
+                if isinstance(compiled_regex, _DeferredRegex):
+                    compiled_regex.check()
+        except Exception:
+            self.named = names
+            raise
+        try:
+            for (expression, method_dict, lazy, parser, name), regex in zip(
+                    pending, found):
+                self._add_mapping(expression, method_dict, lazy, parser,
+                                  regex[1], tree=regex[2])
+        finally:
+            self.invalidate()
+
+    def _add_mapping(self, expression, method_dict, lazy, parser, regex,
+                     facts=None, tree=None):
+        """Make the `Mapping` for `add`, put it in and return it.
+
+        `lazy` lists the methods whose handlers are unresolved
+        `LazyHandler` proxies, which are told where they were put.
+        """
+        mapping = self._append(Mapping(regex, method_dict, expression,
+                                       parser, facts, tree))
+        for meth in lazy:
+            method_dict[meth].slots.append((mapping[1], meth))
+        return mapping
+
+    def _append(self, mapping):
+        """Merge or append a `Mapping` and return it.
+
+        The caller must `invalidate` once done adding.
+        """
+        merged = self._merge(mapping)
+        if merged is not None:
+            return merged
         self.mappings.append(mapping)
+        index = len(self.mappings) - 1
+        self._regexes[_regex_key(mapping[0])] = index
+        if self._indexed == index:
+            self._indexed += 1
+            if self._overlaps is not None:
+                self._overlaps.add(index, _signature(mapping))
         return mapping
 
+    def _merge(self, mapping):
+        """Merge mapping's methods into an earlier one with its regex.
+
+        Only done where it changes nothing: the earlier mapping must not
+        take ``_ANY_``, and no mapping between the two may match a path
+        they match. Methods the earlier mapping has keep their apps, as
+        they were the ones found before. Returns the mapping merged into,
+        or None.
+
+        The mappings are indexed by regex and, once a merge needs it, by
+        `_signature` (see `_Overlaps`), as they are appended, so this
+        costs about the same however big the table is.
+        """
+        mappings = self.mappings
+        if not self.merge_methods or isinstance(mappings, RouteTable):
+            return None
+        key = _regex_key(mapping[0])
+        index = self._regexes.get(key)
+        if self._indexed != len(mappings) or (
+                index is not None and (index >= len(mappings) or
+                                       _regex_key(mappings[index][0]) != key)):
+            # The table has changed under us; look again.
+            self._reindex()
+            index = self._regexes.get(key)
+        if index is None:
+            return None
+        earlier = mappings[index]
+        if '_ANY_' in earlier[1]:
+            return None
+        if index < len(mappings) - 1:
+            signature = _signature(mapping)
+            if signature is None:
+                return None
+            overlaps = self._overlaps
+            if overlaps is None:
+                overlaps = self._overlaps = _Overlaps()
+                for number, other in enumerate(mappings):
+                    overlaps.add(number, _signature(other))
+            if any(number > index
+                   for number in overlaps.overlapping(signature)):
+                return None
+        for method, app in mapping[1].items():
+            earlier[1].setdefault(method, app)
+        return earlier
+
+    def _reindex(self):
+        """Index the mappings by regex for `_merge`, from scratch."""
+        self._regexes = dict((_regex_key(mapping[0]), index)
+                             for index, mapping in enumerate(self.mappings))
+        self._indexed = len(self.mappings)
+        self._overlaps = None
+
+    def add_name(self, name, expression, parser=None):
+        """Name a path expression, so `url_for` can build its URLs.
+
+        The parser (by default the selector's) must have a ``parse``
+        method like `SimpleParser`.
+        """
+        if parser is None:
+            parser = self.parser
+        self._add_name(name, expression, parser, None)
+
+    def _add_name(self, name, expression, parser, tree):
+        """Name an expression for `add_name`, given its tree if known."""
+        if not hasattr(parser, 'parse'):
+            raise ValueError("Can't build URLs for %r without a parser "
+                             "that can parse it." % expression)
+        if tree is None:
+            tree = parser.parse(expression)
+        self.named[name] = UrlTemplate(tree[0], parser.patterns)
+
+    def url_for(self, route_name, *args, **values):
+        """Build a URL for a named route; see `UrlTemplate`."""
+        return self.named[route_name](*args, **values)
+
     def __call__(self, environ, start_response):
-        """Delegate request to the appropriate WSGI app."""
-        app, svars, methods, matched = \
-            self.select(environ['PATH_INFO'], environ['REQUEST_METHOD'])
+        """Delegate request to the appropriate WSGI app.
+
+        With `lean_args`, see `_lean_call`.
+        """
+        if self.lean_args:
+            return self._lean_call(environ, start_response)
+        pos = self.path_offset and environ.get('selector.offset', 0)
+        if pos:
+            app, svars, methods, matched = self.select(
+                environ['PATH_INFO'], environ['REQUEST_METHOD'], pos)
+        else:
+            app, svars, methods, matched = \
+                self.select(environ['PATH_INFO'], environ['REQUEST_METHOD'])
         unnamed, named = [], {}
         for k, v in svars.items():
             if k.startswith('__pos'):
@@ -131,40 +2217,574 @@ class Selector(object):
         environ['wsgiorg.routing_args'] = unnamed, named
         environ['selector.methods'] = methods
         environ.setdefault('selector.matches', []).append(matched)
-        if self.consume_path:
+        if self.path_offset:
+            self._consume(environ, app, matched, pos)
+        elif self.consume_path:
             environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + matched
             environ['PATH_INFO'] = environ['PATH_INFO'][len(matched):]
         return app(environ, start_response)
 
-    def select(self, path, method):
-        """Figure out which app to delegate to or send 404 or 405.
+    def _lean_call(self, environ, start_response):
+        """Delegate as `__call__` does, building the routing args another way.
 
+        The routing args are taken straight from ``match.groups()`` by
+        the group numbers in the mapping's ``layout`` (see `_layout`),
+        worked out when it was added, and the deprecated
+        ``selector.vars`` is left out. That only pays off for routes with
+        several args or positional ones. The ``selector.methods`` list is
+        shared between requests; don't change it.
         """
-        response = (self.status404, {}, [], '')
+        pos = self.path_offset and environ.get('selector.offset', 0)
+        matcher = self._linear
+        if matcher is None or pos or self.by_method:
+            found = self._found(environ['PATH_INFO'],
+                                environ['REQUEST_METHOD'], pos)
+        else:
+            found = self._select_linear(matcher, environ['PATH_INFO'],
+                                        environ['REQUEST_METHOD'],
+                                        _arg_values)
+        app, values, methods, matched, index, mapping = found
+        if mapping is None:
+            args, kwargs = [], {}
+        else:
+            labels = _layout_of(mapping)[2]
+            count = len(values) - len(labels)
+            args = values[:count]
+            kwargs = dict(zip(labels, values[count:]))
+        routing_args = environ.get('wsgiorg.routing_args')
+        if routing_args is not None:
+            args = routing_args[0] + args
+            kwargs.update(routing_args[1])
+        environ['wsgiorg.routing_args'] = args, kwargs
+        environ['selector.methods'] = methods
+        environ.setdefault('selector.matches', []).append(matched)
+        self._consume(environ, app, matched, pos)
+        return app(environ, start_response)
+
+    def _consume(self, environ, app, matched, pos):
+        """Move the matched part of the path along before calling app.
 
-        for regex, method_dict in self.mappings:
+        With `consume_path` it goes from ``PATH_INFO`` to ``SCRIPT_NAME``.
+        With `path_offset` too, while app is another such `Selector` only
+        ``environ['selector.offset']``, the length of the path consumed
+        so far, is moved on, and the two are rewritten just once, for the
+        first app that is not.
+        """
+        if not self.path_offset:
+            if self.consume_path:
+                environ['SCRIPT_NAME'] = \
+                    environ.get('SCRIPT_NAME', '') + matched
+                environ['PATH_INFO'] = environ['PATH_INFO'][len(matched):]
+            return
+        if self.consume_path:
+            pos += len(matched)
+        if isinstance(app, Selector) and app.path_offset:
+            environ['selector.offset'] = pos
+        elif pos:
+            path = environ['PATH_INFO']
+            script_name = environ.get('SCRIPT_NAME', '')
+            environ['SCRIPT_NAME'] = script_name + path[:pos]
+            environ['PATH_INFO'] = path[pos:]
+            environ.pop('selector.offset', None)
+
+    def select(self, path, method, pos=0):
+        """Figure out which app to delegate to or send 404 or 405.
+
+        Returns ``(app, vars, methods, matched)``. With a `cache` the
+        answer for each path and method is remembered, and with `hits`
+        the mapping chosen is counted. Given `pos`, the path is matched
+        from there on, as if it were ``path[pos:]``.
+        """
+        matcher = self._linear
+        if matcher is None or pos or self.by_method:
+            return self._answer(path, method, pos)
+        # The default: a plain `LinearMatcher` scanned right here.
+        if path in matcher.exact or path.endswith('\n'):
+            entries = matcher.candidate_entries(path)
+        else:
+            entries = matcher.dynamic_entries
+        allowed = None
+        for index, regex, mapping, converters in entries:
             match = regex.search(path)
-            if match:
-                methods = list(method_dict.keys())
-                if method in method_dict:
-                    return (method_dict[method],
-                            match.groupdict(),
-                            methods,
-                            match.group(0))
-                elif '_ANY_' in method_dict:
-                    return (method_dict['_ANY_'],
-                            match.groupdict(),
-                            methods,
-                            match.group(0))
-                else:
-                    # Do not return the 405 response right away, there could
-                    # still be a match in mappings we haven't tried yet.
-                    response = (self.status405, {}, methods, '')
+            if match is None:
+                continue
+            if converters:
+                svars = _groups(mapping, match)
+                if svars is None:
+                    continue
+            else:
+                svars = match.groupdict()
+            method_dict = mapping[1]
+            if method in method_dict:
+                return (method_dict[method], svars, list(method_dict),
+                        match.group(0))
+            elif '_ANY_' in method_dict:
+                return (method_dict['_ANY_'], svars, list(method_dict),
+                        match.group(0))
+            elif allowed is None:
+                allowed = list(method_dict)
+            else:
+                allowed.extend(m for m in method_dict if m not in allowed)
+        if allowed is None:
+            return self.status404, {}, [], ''
+        return self.status405, {}, allowed, ''
+
+    def _answer(self, path, method, pos=0):
+        """Do `select` any way but the default one."""
+        if self.cache is None and self.hits is None and not self.lean_args:
+            return self._select(path, method, pos)[:4]
+        app, svars, methods, matched, index, mapping = \
+            self._found(path, method, pos)
+        if self.lean_args:
+            # Lean answers hold just the values; see `_arg_values`.
+            names = () if mapping is None else _layout_of(mapping)[1]
+            svars = dict(zip(names, svars))
+        if self.cache is None:
+            return app, svars, methods, matched
+        if methods.__class__ is list:
+            methods = list(methods)
+        return app, dict(svars), methods, matched
+
+    def _found(self, path, method, pos=0):
+        """Do the work of `select`, using the cache and counting hits.
+
+        Also returns the index of the mapping chosen and the mapping, or
+        None for both. Answers may be shared by the cache; don't change
+        them.
+        """
+        cache = self.cache
+        if cache is None:
+            found = self._select(path, method, pos)
+        else:
+            # Keyed by the rest of the path, so it is copied here, but
+            # paths that differ only in what was consumed share answers.
+            key = (path[pos:] if pos else path, method)
+            found = cache.get(key)
+            if found is None:
+                found = self._select(path, method, pos)
+                cache.put(key, found)
+        if self.hits is not None and found[4] is not None:
+            self.hits[found[4]] += 1
+        return found
+
+    def _select(self, path, method, pos=0):
+        """Scan the mappings for `select`.
+
+        Also returns the index of the mapping chosen and the mapping, or
+        None for both.
+        """
+        matcher = self._matcher
+        if matcher is None:
+            matcher = self._matcher = self.matcher(self.mappings)
+        mappings = matcher.mappings
+        values = _arg_values if self.lean_args else _groups
+        if (matcher.__class__ is LinearMatcher and
+                mappings.__class__ is not RouteTable):
+            if self.cache is None and self.hits is None:
+                # `select` scans this one itself from now on.
+                self._linear = matcher
+            if not (pos or self.by_method):
+                return self._select_linear(matcher, path, method, values)
+        if self.by_method:
+            return self._select_by_method(matcher, path, method, pos)
+        if mappings.__class__ is RouteTable:
+            return self._select_route(matcher, path, method, pos)
+        allowed = None
+
+        for index, match in _matches(matcher, path, pos):
+            svars = values(mappings[index], match)
+            if svars is None:
+                continue
+            regex, method_dict = mappings[index]
+            methods = list(method_dict.keys())
+            if method in method_dict:
+                return (method_dict[method],
+                        svars,
+                        methods,
+                        match.group(0),
+                        index,
+                        mappings[index])
+            elif '_ANY_' in method_dict:
+                return (method_dict['_ANY_'],
+                        svars,
+                        methods,
+                        match.group(0),
+                        index,
+                        mappings[index])
+            elif allowed is None:
+                # Do not return the 405 response right away, there could
+                # still be a match in mappings we haven't tried yet.
+                allowed = methods
+            else:
+                allowed.extend(m for m in methods if m not in allowed)
+
+        if allowed is None:
+            return self.status404, {}, [], '', None, None
+        return self.status405, {}, allowed, '', None, None
 
-        return response
+    def _select_linear(self, matcher, path, method, values):
+        """Scan a `LinearMatcher` for `_select`, without its generator.
 
-    def slurp_file(self, filename, prefix=None, parser=None, wrap=None):
-        """Read mappings from a simple text file. (See README.md.)"""
+        `select` does the same itself for the default options.
+        """
+        allowed = None
+        for index, regex, mapping, converters in \
+                matcher.candidate_entries(path):
+            match = regex.search(path)
+            if match is None:
+                continue
+            svars = values(mapping, match)
+            if svars is None:
+                continue
+            method_dict = mapping[1]
+            if method in method_dict:
+                app = method_dict[method]
+            elif '_ANY_' in method_dict:
+                app = method_dict['_ANY_']
+            elif allowed is None:
+                allowed = list(method_dict)
+                continue
+            else:
+                allowed.extend(m for m in method_dict if m not in allowed)
+                continue
+            return (app, svars, list(method_dict), match.group(0), index,
+                    mapping)
+        if allowed is None:
+            return self.status404, {}, [], '', None, None
+        return self.status405, {}, allowed, '', None, None
+
+    def _select_route(self, matcher, path, method, pos=0):
+        """Scan a frozen `RouteTable` for `_select`."""
+        allowed = None
+        routes = matcher.mappings
+        values = _arg_values if self.lean_args else _groups
+        for index, match in _matches(matcher, path, pos):
+            route = routes[index]
+            svars = values(route, match)
+            if svars is None:
+                continue
+            methods = route.methods
+            if method in methods:
+                app = methods[method]
+            elif route.any:
+                app = methods['_ANY_']
+            elif allowed is None:
+                allowed = route.allowed
+                continue
+            else:
+                allowed = AllowedMethods(allowed + tuple(
+                    m for m in route.allowed if m not in allowed))
+                continue
+            return (app, svars, route.allowed, match.group(0), index,
+                    route)
+        if allowed is None:
+            return self.status404, {}, (), '', None, None
+        return self.status405, {}, allowed, '', None, None
+
+    def _method_table(self, matcher, method):
+        """Return a matcher for the mappings that take `method`.
+
+        Also returns the list of their indexes in the whole table.
+        Methods no mapping names share the table of ``_ANY_`` mappings.
+        The tables are kept on the main matcher, so they go with it.
+        """
+        tables = getattr(matcher, 'method_tables', None)
+        if tables is None:
+            mappings = matcher.mappings
+            names = set()
+            for regex, method_dict in mappings:
+                names.update(method_dict)
+            names.discard('_ANY_')
+            tables = {}
+            for name in list(names) + [None]:
+                indexes = [i for i, (regex, method_dict) in enumerate(mappings)
+                           if name in method_dict or '_ANY_' in method_dict]
+                subset = [mappings[i] for i in indexes]
+                if mappings.__class__ is RouteTable:
+                    subset = RouteTable(subset)
+                tables[name] = self.matcher(subset), indexes
+            matcher.method_tables = tables
+        return tables.get(method) or tables[None]
+
+    def _select_by_method(self, matcher, path, method, pos=0):
+        """Look in the table for `method` first, for `_select`.
+
+        Only if nothing there matches is the whole table scanned, to
+        tell a 405 from a 404.
+        """
+        table, indexes = self._method_table(matcher, method)
+        mappings = table.mappings
+        values = _arg_values if self.lean_args else _groups
+        for index, match in _matches(table, path, pos):
+            mapping = mappings[index]
+            svars = values(mapping, match)
+            if svars is None:
+                continue
+            methods = mapping[1]
+            if method in methods:
+                app = methods[method]
+            else:
+                app = methods['_ANY_']
+            allowed = getattr(mapping, 'allowed', None)
+            if allowed is None:
+                allowed = list(methods.keys())
+            return (app, svars, allowed, match.group(0), indexes[index],
+                    mapping)
+        if matcher.mappings.__class__ is RouteTable:
+            return self._select_route(matcher, path, None, pos)
+        return self._select_path(matcher, path, pos)
+
+    def _select_path(self, matcher, path, pos=0):
+        """Answer 404 or 405 with every method allowed for path."""
+        allowed = None
+        for index, match in _matches(matcher, path, pos):
+            mapping = matcher.mappings[index]
+            if _groups(mapping, match) is None:
+                continue
+            methods = mapping[1]
+            if allowed is None:
+                allowed = list(methods.keys())
+            else:
+                allowed.extend(m for m in methods if m not in allowed)
+        if allowed is None:
+            return self.status404, {}, [], '', None, None
+        return self.status405, {}, allowed, '', None, None
+
+    def select_many(self, paths, methods=None, chunk_size=10000):
+        """Find the mapping for each of many requests, as for a log file.
+
+        Returns ``(indexes, columns)``: the index in `mappings` chosen
+        for each request, or -1 for a 404 or 405, and a dict with a list
+        for each captured group name holding each request's value or
+        None. See `select_chunks`.
+        """
+        indexes, columns = [], {}
+        for chunk, chunk_columns in self.select_chunks(paths, methods,
+                                                       chunk_size):
+            for name in chunk_columns:
+                if name not in columns:
+                    columns[name] = [None] * len(indexes)
+            for name, values in columns.items():
+                values.extend(chunk_columns.get(name) or [None] * len(chunk))
+            indexes.extend(chunk)
+        return indexes, columns
+
+    def select_chunks(self, paths, methods=None, chunk_size=10000,
+                      memo_size=100000):
+        """Like `select_many`, but yield the results a chunk at a time.
+
+        `paths` and `methods` may be any iterables, like files or NumPy
+        arrays, and are read `chunk_size` requests at a time. Without
+        `methods` any method is fine. Paths repeated within a chunk are
+        only looked up once, and the last `memo_size` answers are kept
+        for later chunks. Each chunk is checked against the literal
+        prefixes of the mappings in one go, so each path only tries the
+        regexes it might match. Neither `cache` nor `hits` is touched.
+        """
+        matcher = self._matcher
+        if matcher is None:
+            matcher = self._matcher = self.matcher(self.mappings)
+        mappings = matcher.mappings
+        prefixes = {}
+        for index, mapping in enumerate(mappings):
+            features = getattr(mapping, 'features', None)
+            prefix = features[0] if features else ''
+            prefixes.setdefault(prefix, []).append(index)
+        memo = LRUCache(memo_size)
+        paths = iter(paths)
+        if methods is None:
+            methods = repeat(None)
+        else:
+            methods = iter(methods)
+        requests = ((path, next(methods)) for path in paths)
+        while True:
+            chunk = list(islice(requests, chunk_size))
+            if not chunk:
+                return
+            found = {}
+            todo = OrderedDict()
+            for request in chunk:
+                if request not in found:
+                    found[request] = memo.get(request)
+                    if found[request] is None:
+                        todo[request[0]] = None
+            candidates = dict(zip(todo, _prefix_candidates(list(todo),
+                                                           prefixes)))
+            for request, result in found.items():
+                if result is None:
+                    path, method = request
+                    result = found[request] = self._classify(
+                        mappings, candidates[path], path, method)
+                    memo.put(request, result)
+            results = [found[request] for request in chunk]
+            columns = {}
+            for row, (index, svars) in enumerate(results):
+                for name, value in svars.items():
+                    if name not in columns:
+                        columns[name] = [None] * len(results)
+                    columns[name][row] = value
+            yield [index for index, svars in results], columns
+
+    def _classify(self, mappings, candidates, path, method):
+        """Try `candidates` in order for `select_chunks`."""
+        for index in candidates:
+            regex, method_dict = mappings[index]
+            match = regex.search(path)
+            if match and (method is None or method in method_dict or
+                          '_ANY_' in method_dict):
+                svars = _groups(mappings[index], match)
+                if svars is not None:
+                    return index, svars
+        return -1, {}
+
+    def freeze(self):
+        """Swap the mappings for a read-only `RouteTable` and return it.
+
+        The routes in it have their allowed methods, ``Allow`` header and
+        so on worked out once, so dispatch doesn't have to. Methods are
+        reported as tuples. Adding routes to a frozen selector raises a
+        TypeError; set `mappings` to a list to thaw it.
+        """
+        if not isinstance(self.mappings, RouteTable):
+            self.mappings = RouteTable(self.mappings)
+        return self.mappings
+
+    def warmup(self, freeze_gc=True):
+        """Do all the work put off until the first requests, up front.
+
+        Meant for a server that builds its app before forking workers.
+        Resolves every `LazyHandler`, compiles the regexes `add_many`
+        left for later, builds the matcher and its indexes
+        (and the per-method tables with `by_method`), and does the same
+        for any selectors found as handlers. Then, with `freeze_gc` and
+        on a Python with ``gc.freeze()``, collects garbage and freezes
+        what's left, so the collector doesn't touch the objects made so
+        far and they stay shared with the workers.
+
+        Returns a dict counting the ``selectors``, ``routes``, distinct
+        ``regexes`` and distinct ``handlers`` made ready, and the
+        ``resolved`` lazy handlers and ``compiled`` regexes among them.
+        """
+        counts = dict.fromkeys(('selectors', 'routes', 'regexes', 'handlers',
+                                'resolved', 'compiled'), 0)
+        self._warmup(counts, set())
+        if freeze_gc and hasattr(gc, 'freeze'):
+            gc.collect()
+            gc.freeze()
+        return counts
+
+    def _warmup(self, counts, seen):
+        """Warm up this selector and those under it, for `warmup`."""
+        seen.add(id(self))
+        counts['selectors'] += 1
+        regexes, handlers = set(), set()
+        nested = []
+        for regex, methods in self.mappings:
+            counts['routes'] += 1
+            if (isinstance(regex, _DeferredRegex) and
+                    'compiled' not in regex.__dict__):
+                counts['compiled'] += 1
+                regex.compile()
+                # Looking them up keeps them on the regex.
+                regex.search, regex.match
+            regexes.add(id(regex))
+            for meth, app in list(methods.items()):
+                if isinstance(app, LazyHandler):
+                    if app.target is None:
+                        counts['resolved'] += 1
+                    methods[meth] = app = app.resolved()
+                if id(app) not in handlers:
+                    handlers.add(id(app))
+                    if isinstance(app, Selector) and id(app) not in seen:
+                        nested.append(app)
+        counts['regexes'] += len(regexes)
+        counts['handlers'] += len(handlers)
+        matcher = self._matcher
+        if matcher is None:
+            matcher = self._matcher = self.matcher(self.mappings)
+        if self.by_method:
+            self._method_table(matcher, None)
+        for app in nested:
+            app._warmup(counts, seen)
+
+    def save_profile(self, filename):
+        """Write the `hits` counted so far to a JSON profile file.
+
+        Mappings are named by their HTTP methods and regex, so the
+        profile still applies after a restart or a reordering. Raises
+        ValueError if hits aren't being counted (see ``record_hits``).
+        """
+        if self.hits is None:
+            raise ValueError("Hits aren't counted without record_hits.")
+        profile = {}
+        for index, count in self.hits.items():
+            key = _route_key(self.mappings[index])
+            profile[key] = profile.get(key, 0) + count
+        with open(filename, 'w') as the_file:
+            json.dump(profile, the_file, indent=0, sort_keys=True)
+
+    def load_profile(self, filename):
+        """Reorder the mappings by the hits in a profile file."""
+        with open(filename, 'r') as the_file:
+            self.reorder(json.load(the_file))
+
+    def reorder(self, profile):
+        """Move the most hit mappings up the table where it's safe.
+
+        `profile` maps route names (see `save_profile`) to hit counts.
+        Two mappings only trade places if no path can match both, as
+        worked out from their path expressions, so every request is
+        routed just as before. Mappings that can't be taken apart keep
+        their place relative to all others.
+        """
+        mappings = list(self.mappings)
+        hot = [profile.get(_route_key(mapping), 0) for mapping in mappings]
+        signatures = [_signature(mapping) for mapping in mappings]
+        after = [[] for mapping in mappings]
+        blockers = [0] * len(mappings)
+        overlaps = _Overlaps()
+        for j, signature in enumerate(signatures):
+            for i in overlaps.overlapping(signature):
+                after[i].append(j)
+                blockers[j] += 1
+            overlaps.add(j, signature)
+        ready = [(-hot[j], j) for j in range(len(mappings)) if not blockers[j]]
+        heapify(ready)
+        order = []
+        while ready:
+            i = heappop(ready)[1]
+            order.append(i)
+            for j in after[i]:
+                blockers[j] -= 1
+                if not blockers[j]:
+                    heappush(ready, (-hot[j], j))
+        self.mappings = [mappings[i] for i in order]
+        if self.hits is not None:
+            moved = dict((old, new) for new, old in enumerate(order))
+            self.hits = Counter(dict((moved[index], count) for index, count
+                                     in self.hits.items()))
+
+    def slurp_file(self, filename, prefix=None, parser=None, wrap=None,
+                   cached=None, bulk=False):
+        """Read mappings from a simple text file. (See README.md.)
+
+        With `cached` (by default `mapfile_cache`), what was read is kept
+        next to the file; see `_slurp_cached`. With `bulk`, the mappings
+        are added in one go at the end, as by `add_many`.
+        """
+        if cached is None:
+            cached = self.mapfile_cache
+        if (cached and self._pending is None and
+                self._slurp_cached(filename, prefix, parser, wrap)):
+            return
+        if bulk and self._pending is None:
+            self._pending = []
+            try:
+                self.slurp_file(filename, prefix, parser, wrap, False)
+            finally:
+                pending, self._pending = self._pending, None
+            self._add_pending(pending)
+            return
         with open(filename, 'rb') as the_file:
             oldprefix = self.prefix
             if prefix is not None:
@@ -192,6 +2812,236 @@ class Selector(object):
                 self.parser = oldparser
                 self.prefix = oldprefix
 
+    def _slurp_cached(self, filename, prefix, parser, wrap):
+        """Slurp a mapping file by way of its cache file.
+
+        The cache file, named by adding ``.cache`` to filename, holds the
+        routes the file adds: their expressions with prefixes, regexes,
+        facts (see `Mapping`) and the statements for their handlers and
+        for the parsers and wraps in effect. It is keyed by a hash of the
+        file, `mapfile_cache_format`, the source of this module (see
+        `_source_key`), the starting prefix and the `_parser_key` of the
+        starting parser and of each parser the file switches to. If the
+        key matches, the handlers are resolved and the routes added
+        without parsing anything. Otherwise the file is read as usual
+        and the cache file written, unless a parser switched to has no
+        ``cache_key()``. Returns False, having done nothing, if the
+        starting parser has none.
+        """
+        # Start where slurp_file would; it only takes wrap with a parser.
+        prefix = self.prefix if prefix is None else prefix
+        start_parser = self.parser if parser is None else parser
+        if parser is None:
+            wrap = self.wrap
+        parser_key = _parser_key(start_parser)
+        if parser_key is None:
+            return False
+        with open(filename, 'rb') as the_file:
+            digest = hashlib.sha1(the_file.read())
+        digest.update(repr((mapfile_cache_format, _source_key(), prefix,
+                            parser_key)).encode('utf-8'))
+        cache_name = filename + '.cache'
+        try:
+            with open(cache_name) as cache_file:
+                cache = json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            cache = None
+        if cache is not None:
+            key = self._cache_key(digest, cache.get('parsers', ()))
+            if key is not None and cache.get('key') == key:
+                self._load_routes(cache['routes'], start_parser, wrap)
+                return True
+        recorder = _Recorder(prefix=prefix, parser=start_parser, wrap=wrap,
+                             lazy_handlers=self.lazy_handlers)
+        recorder._handlers = self._handlers
+        recorder.merge_methods = False
+        recorder.slurp_file(filename, cached=False)
+        routes = []
+        for mapping, methods, route_parser, route_wrap in recorder.routes:
+            merged = self._append(mapping)
+            statements = []
+            for meth, app in methods.items():
+                if isinstance(app, LazyHandler):
+                    statements.append([meth, app.statement])
+                    if merged is not mapping:
+                        app.slots.append((merged[1], meth))
+                else:
+                    statements.append([meth, recorder.specs[id(app)][1]])
+            literals, features, typed = mapping.facts
+            routes.append([mapping.expression, mapping[0].pattern,
+                           statements,
+                           recorder.statement(route_parser),
+                           recorder.statement(route_wrap),
+                           literals, features, typed])
+        self.invalidate()
+        parsers = sorted(set(route[3] for route in routes
+                             if route[3] is not None))
+        key = self._cache_key(digest, parsers)
+        if key is None:
+            return True
+        # Write it to the side and swap it in, so workers starting
+        # together never read half a cache file.
+        temp_name = '%s.%s.%s' % (cache_name, os.getpid(),
+                                  threading.current_thread().ident)
+        try:
+            with open(temp_name, 'w') as cache_file:
+                json.dump({'key': key, 'parsers': parsers, 'routes': routes},
+                          cache_file)
+            _replace(temp_name, cache_name)
+        except (IOError, OSError):
+            try:
+                os.remove(temp_name)
+            except OSError:
+                pass
+        return True
+
+    def _cache_key(self, digest, parsers):
+        """Finish the key of a mapping file cache, for `_slurp_cached`.
+
+        Adds the `_parser_key` of the parser each statement in parsers
+        resolves to. Returns None if one has none or won't resolve.
+        """
+        digest = digest.copy()
+        for statement in parsers:
+            try:
+                parser_key = _parser_key(self._resolve(statement))
+            except Exception:
+                return None
+            if parser_key is None:
+                return None
+            digest.update(repr((statement, parser_key)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _load_routes(self, routes, parser, wrap):
+        """Add the routes from a mapping file cache, for `_slurp_cached`.
+
+        Parsers and wraps given as None are the starting ones.
+        """
+        resolved = {None: None}
+        for (expression, regex, methods, parser_statement, wrap_statement,
+             literals, features, typed) in routes:
+            for statement in (parser_statement, wrap_statement):
+                if statement not in resolved:
+                    resolved[statement] = self._resolve(statement)
+            route_parser = resolved[parser_statement] or parser
+            route_wrap = resolved[wrap_statement] or wrap
+            method_dict = {}
+            lazy = []
+            for meth, statement in methods:
+                app = self._handler(statement)
+                if isinstance(app, LazyHandler):
+                    app.wrap = route_wrap
+                    lazy.append(meth)
+                elif route_wrap is not None:
+                    app = route_wrap(app)
+                method_dict[meth] = app
+            facts = (None if literals is None else tuple(literals),
+                     None if features is None else tuple(features),
+                     tuple(tuple(pair) for pair in typed))
+            self._add_mapping(expression, method_dict, lazy, route_parser,
+                              re.compile(regex), facts)
+        self.invalidate()
+
+    def _resolve(self, statement):
+        """Resolve a statement from a mapping file to an object."""
+        return resolver.resolve(statement)
+
+    def _handler(self, statement):
+        """Resolve a handler statement from a mapping file.
+
+        With `lazy_handlers`, return a `LazyHandler` for it instead.
+        """
+        if self.lazy_handlers:
+            return LazyHandler(statement.strip(), self._resolve,
+                               self._handlers)
+        return self._resolve(statement)
+
+    def reload(self, background=False):
+        """Read `mapfile` again and swap in the routes from it.
+
+        The new routes and their matcher are built off to the side, with
+        the prefix, parser and wrap the selector has now, and put in place
+        by assigning the matcher, which is all a request looks at, so
+        requests never wait on a lock. Every regex is compiled before
+        then. If reading the file fails (with a MappingFileError, say, or
+        a ``re.error`` for a bad regex) the old routes stay. Routes not
+        from the mapping file are dropped.
+
+        With `background`, does that on a new thread and returns it;
+        errors are kept in `reload_error` instead of raised.
+        """
+        if self.mapfile is None:
+            raise ValueError("There's no mapfile to reload.")
+        if background:
+            thread = threading.Thread(target=self._reload_quietly)
+            thread.daemon = True
+            thread.start()
+            return thread
+        fresh = copy.copy(self)
+        fresh.cache = fresh.hits = None
+        fresh.mappings = []
+        fresh._reindex()
+        fresh.slurp_file(self.mapfile, bulk=True)
+        for regex, methods in fresh.mappings:
+            if isinstance(regex, _DeferredRegex):
+                regex.compile()
+        if isinstance(self.mappings, RouteTable):
+            fresh.freeze()
+        matcher = fresh.matcher(fresh.mappings)
+        if self.by_method:
+            fresh._method_table(matcher, None)
+        self._regexes, self._indexed, self._overlaps = \
+            fresh._regexes, fresh._indexed, fresh._overlaps
+        self._mappings = _MappingList.owned(fresh.mappings, self)
+        self._matcher, self._linear = matcher, None
+        if self.cache is not None:
+            self.cache = LRUCache(self.cache.maxsize)
+        if self.hits is not None:
+            self.hits = Counter()
+        self.reload_error = None
+
+    def _reload_quietly(self):
+        """Reload, keeping any error in `reload_error`."""
+        try:
+            self.reload()
+        except Exception as error:
+            self.reload_error = error
+
+    def watch(self, interval=2.0):
+        """Reload whenever `mapfile` changes, checking every `interval`.
+
+        Checks the file's modification time and size on a daemon thread,
+        which is returned. Stop it with `unwatch`.
+        """
+        stop = self._watching = threading.Event()
+        thread = threading.Thread(target=self._watch, args=(
+            stop, interval, self._mapfile_stamp()))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def unwatch(self):
+        """Stop the thread started by `watch`, if there is one."""
+        if self._watching is not None:
+            self._watching.set()
+            self._watching = None
+
+    def _watch(self, stop, interval, stamp):
+        """Poll `mapfile` for `watch` until stop is set."""
+        while not stop.wait(interval):
+            now = self._mapfile_stamp()
+            if now != stamp:
+                stamp = now
+                self._reload_quietly()
+
+    def _mapfile_stamp(self):
+        """Return what `watch` compares to tell that `mapfile` changed."""
+        try:
+            stat = os.stat(self.mapfile)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
     def _parse_line(self, line, path, methods):
         """Parse one line of a mapping file.
 
@@ -211,16 +3061,16 @@ class Selector(object):
             if directive == 'prefix':
                 self.prefix = rest.strip()
             if directive == 'parser':
-                self.parser = resolver.resolve(rest.strip())
+                self.parser = self._resolve(rest.strip())
             if directive == 'wrap':
-                self.wrap = resolver.resolve(rest.strip())
+                self.wrap = self._resolve(rest.strip())
         # HTTP Method -> Handler:
         elif line[0] in ' \t':
             if path is None:
                 raise MappingFileError(
                     "Specify a path expression first.")
             meth, app = line.strip().split(' ', 1)
-            methods[meth.strip()] = resolver.resolve(app)
+            methods[meth.strip()] = self._handler(app)
         # Path Expression:
         else:
             if path and methods:
@@ -230,6 +3080,606 @@ class Selector(object):
         return path, methods
 
 
+class ChainSelector(Selector):
+    """One route table for selectors chained by their `status404`.
+
+    With ``s1.status404 = s2`` a path none of the mappings of ``s1``
+    match goes on to ``s2``, and so on down the chain, each time through
+    a whole `Selector.__call__`. A chain selector follows those links
+    from `first` and puts all their mappings in one table, so a request
+    is matched once, with any matcher and the `cache`. The first
+    selector whose mappings match the path answers, with its own 405 if
+    it lacks the method, just as in the chain, and the 404 is that of
+    the last one. Other settings are taken from `first` unless given.
+
+    With `by_method` or once frozen (see `Selector.freeze`), the merged
+    table is indexed as a selector's would be, and what is found still
+    answers as the chain would.
+
+    The selectors must agree on `consume_path`, and ``selector.matches``
+    gets no empty match for each selector passed over. Mappings added
+    later, or given as `mappings` or in a `mapfile`, go with the last
+    selector. Build the chain selector again when the selectors change.
+    """
+
+    merge_methods = False
+
+    def __init__(self, first, **kwargs):
+        """Merge the tables of the selectors chained from `first`."""
+        for name in ('parser', 'consume_path', 'matcher', 'lazy_handlers',
+                     'lean_args', 'path_offset', 'by_method'):
+            kwargs.setdefault(name, getattr(first, name))
+        # Added once the chain is in, so they go with the last selector.
+        added = kwargs.pop('mappings', None)
+        mapfile = kwargs.pop('mapfile', None)
+        Selector.__init__(self, **kwargs)
+        self.chain = []
+        self.bounds = []
+        self.status405s = []
+        mappings = []
+        selector = first
+        while (isinstance(selector, Selector) and
+               not any(selector is seen for seen in self.chain)):
+            if selector.consume_path != self.consume_path:
+                raise ValueError("Chained selectors differ in consume_path")
+            if self.chain:
+                self.bounds.append(len(mappings))
+            self.chain.append(selector)
+            self.status405s.append(selector.status405)
+            mappings.extend(selector.mappings)
+            selector = selector.status404
+        self.status404 = selector
+        for selector in reversed(self.chain):
+            self.named.update(selector.named)
+        self.mappings = mappings
+        self.mapfile = mapfile
+        if mapfile is not None:
+            self.slurp_file(mapfile)
+        if added is not None:
+            self.slurp(added)
+
+    def _segment(self, index, size):
+        """Return the chain position owning mapping index and its end."""
+        segment = bisect_right(self.bounds, index)
+        if segment < len(self.bounds):
+            return segment, self.bounds[segment]
+        return segment, size
+
+    def _select(self, path, method, pos=0):
+        """Scan the merged table for `select`, stopping as the chain would.
+
+        Once a mapping matches the path, only the rest of the mappings
+        from the same selector are tried.
+        """
+        matcher = self._matcher
+        if matcher is None:
+            matcher = self._matcher = self.matcher(self.mappings)
+        if self.by_method:
+            return self._select_by_method(matcher, path, method, pos)
+        return self._select_chain(matcher, path, method, pos)
+
+    def _select_chain(self, matcher, path, method, pos=0):
+        """Scan the whole merged table, for `_select`."""
+        mappings = matcher.mappings
+        if mappings.__class__ is RouteTable:
+            return self._select_route(matcher, path, method, pos)
+        segment = end = None
+        allowed = None
+        values = _arg_values if self.lean_args else _groups
+        for index, match in _matches(matcher, path, pos):
+            if end is not None and index >= end:
+                break
+            mapping = mappings[index]
+            svars = values(mapping, match)
+            if svars is None:
+                continue
+            method_dict = mapping[1]
+            methods = list(method_dict.keys())
+            if method in method_dict:
+                app = method_dict[method]
+            elif '_ANY_' in method_dict:
+                app = method_dict['_ANY_']
+            else:
+                if allowed is None:
+                    segment, end = self._segment(index, len(mappings))
+                    allowed = methods
+                else:
+                    allowed.extend(m for m in methods if m not in allowed)
+                continue
+            return app, svars, methods, match.group(0), index, mapping
+        if allowed is None:
+            return self.status404, {}, [], '', None, None
+        return self.status405s[segment], {}, allowed, '', None, None
+
+    def _select_route(self, matcher, path, method, pos=0):
+        """Scan a frozen `RouteTable` for `_select`, as `_select_chain`."""
+        routes = matcher.mappings
+        segment = end = None
+        allowed = None
+        values = _arg_values if self.lean_args else _groups
+        for index, match in _matches(matcher, path, pos):
+            if end is not None and index >= end:
+                break
+            route = routes[index]
+            svars = values(route, match)
+            if svars is None:
+                continue
+            methods = route.methods
+            if method in methods:
+                app = methods[method]
+            elif route.any:
+                app = methods['_ANY_']
+            elif allowed is None:
+                segment, end = self._segment(index, len(routes))
+                allowed = route.allowed
+                continue
+            else:
+                allowed = AllowedMethods(allowed + tuple(
+                    m for m in route.allowed if m not in allowed))
+                continue
+            return (app, svars, route.allowed, match.group(0), index,
+                    route)
+        if allowed is None:
+            return self.status404, {}, (), '', None, None
+        return self.status405s[segment], {}, allowed, '', None, None
+
+    def _select_by_method(self, matcher, path, method, pos=0):
+        """Look in the table for `method` first, for `_select`.
+
+        A mapping found there answers unless one from an earlier
+        selector in the chain matches the path, as that selector would
+        answer first. Then, and if nothing is found, the whole table is
+        scanned with `_select_chain`.
+        """
+        table, indexes = self._method_table(matcher, method)
+        mappings = table.mappings
+        values = _arg_values if self.lean_args else _groups
+        for index, match in _matches(table, path, pos):
+            mapping = mappings[index]
+            svars = values(mapping, match)
+            if svars is None:
+                continue
+            segment = self._segment(indexes[index], 0)[0]
+            if segment and self._matched_before(matcher, path, pos,
+                                                self.bounds[segment - 1]):
+                break
+            methods = mapping[1]
+            if method in methods:
+                app = methods[method]
+            else:
+                app = methods['_ANY_']
+            allowed = getattr(mapping, 'allowed', None)
+            if allowed is None:
+                allowed = list(methods.keys())
+            return (app, svars, allowed, match.group(0), indexes[index],
+                    mapping)
+        return self._select_chain(matcher, path, method, pos)
+
+    def _matched_before(self, matcher, path, pos, stop):
+        """Tell whether a mapping before index stop matches path."""
+        for index, match in _matches(matcher, path, pos):
+            if index >= stop:
+                return False
+            if _groups(matcher.mappings[index], match) is not None:
+                return True
+        return False
+
+    def _classify(self, mappings, candidates, path, method):
+        """Try `candidates` in order for `select_chunks`, as `_select`."""
+        end = None
+        for index in candidates:
+            if end is not None and index >= end:
+                break
+            regex, method_dict = mappings[index]
+            match = regex.search(path)
+            if not match:
+                continue
+            svars = _groups(mappings[index], match)
+            if svars is None:
+                continue
+            if (method is None or method in method_dict or
+                    '_ANY_' in method_dict):
+                return index, svars
+            if end is None:
+                end = self._segment(index, len(mappings))[1]
+        return -1, {}
+
+    def reorder(self, profile):
+        """Refuse, since mappings would move between selectors."""
+        raise TypeError("Can't reorder a ChainSelector")
+
+
+class _Recorder(Selector):
+    """A selector that remembers where its handlers came from.
+
+    Notes the mapping file statement each object was resolved from and
+    which handlers were wrapped with what, for `dispatch_source` and
+    `Selector._slurp_cached`.
+    """
+
+    mapfile_cache = False
+
+    def __init__(self, *args, **kwargs):
+        """Start with nothing recorded."""
+        self.specs = {}
+        self.wrapped = {}
+        self.routes = []
+        Selector.__init__(self, *args, **kwargs)
+
+    def _resolve(self, statement):
+        """Resolve statement and remember it."""
+        obj = Selector._resolve(self, statement)
+        self.specs[id(obj)] = (obj, statement.strip())
+        return obj
+
+    def statement(self, obj):
+        """Return the statement obj was resolved from, or None."""
+        entry = self.specs.get(id(obj))
+        if entry is None or entry[0] is not obj:
+            return None
+        return entry[1]
+
+    def add(self, path, method_dict=None, prefix=None, name=None,
+            **http_methods):
+        """Wrap the handlers here, remembering what was wrapped.
+
+        Each mapping added is noted in `routes` with its unwrapped
+        handlers and the parser and wrap used.
+        """
+        wrap = self.wrap
+        methods = dict(method_dict or {})
+        methods.update(http_methods)
+        if wrap is None:
+            mapping = Selector.add(self, path, methods, prefix, name)
+            self.routes.append((mapping, methods, self.parser, wrap))
+            return mapping
+        unwrapped = dict(methods)
+        for meth, app in list(methods.items()):
+            if isinstance(app, LazyHandler):
+                app.wrap = wrap
+                continue
+            methods[meth] = wrapped = wrap(app)
+            self.wrapped[id(wrapped)] = (wrapped, wrap, app)
+        self.wrap = None
+        try:
+            mapping = Selector.add(self, path, methods, prefix, name)
+        finally:
+            self.wrap = wrap
+        self.routes.append((mapping, unwrapped, self.parser, wrap))
+        return mapping
+
+
+_dispatch_runtime = '''
+
+
+def _scan(path):
+    found = []
+    for index, (pattern, flags) in enumerate(_patterns):
+        match = re.compile(pattern, flags).search(path)
+        if match:
+            found.append((index, match.groupdict(), match.group(0)))
+    return found
+
+
+def _convert(svars, converters):
+    svars = dict(svars)
+    try:
+        for name, convert in converters:
+            if svars.get(name) is not None:
+                svars[name] = convert(svars[name])
+    except ValueError:
+        return None
+    return svars
+
+
+def select(path, method, pos=0):
+    """Return ``(app, vars, methods, matched)`` like `Selector.select`."""
+    if pos:
+        path = path[pos:]
+    if '\\n' in path:
+        # `$` also matches before a trailing newline; use the regexes.
+        found = _scan(path)
+    else:
+        found = []
+        parts = path.split('/')
+        node = _lengths.get(len(parts))
+        if node is not None:
+            node(parts, path, found)
+        for index, regex in _fallback:
+            match = regex.search(path)
+            if match:
+                found.append((index, match.groupdict(), match.group(0)))
+        found.sort(key=itemgetter(0))
+    allowed = None
+    for index, svars, matched in found:
+        if _converters[index]:
+            svars = _convert(svars, _converters[index])
+            if svars is None:
+                continue
+        methods = _methods[index]
+        if method in methods:
+            return methods[method], svars, list(_allowed[index]), matched
+        if '_ANY_' in methods:
+            return methods['_ANY_'], svars, list(_allowed[index]), matched
+        if allowed is None:
+            allowed = list(_allowed[index])
+        else:
+            allowed.extend(m for m in _allowed[index] if m not in allowed)
+    if allowed is None:
+        return _status404, {}, [], ''
+    return _status405, {}, allowed, ''
+'''
+
+
+class _DispatchWriter(object):
+    """Write the module for `dispatch_source`."""
+
+    def __init__(self, specs, wrapped):
+        """Start an empty module."""
+        self.specs = specs
+        self.wrapped = wrapped
+        self.count = 0
+        self.names = {}
+        self.regexes = {}
+        self.head = []
+        self.functions = []
+        self.tables = []
+
+    def name(self, kind):
+        """Return a new module level name."""
+        self.count += 1
+        return '_%s%s' % (kind, self.count)
+
+    def reference(self, obj, unwrapped=False):
+        """Return the name of a module variable holding obj.
+
+        Handlers the selector wrapped are written wrapped the same way,
+        unless `unwrapped`.
+        """
+        key = (id(obj), unwrapped)
+        if key in self.names:
+            return self.names[key]
+        wrapped = None if unwrapped else self.wrapped.get(id(obj))
+        entry = self.specs.get(id(obj))
+        if wrapped is not None and wrapped[0] is obj:
+            expression = '%s(%s)' % (self.reference(wrapped[1]),
+                                     self.reference(wrapped[2], True))
+        elif isinstance(obj, LazyHandler) and obj.target is None:
+            expression = '_resolve(%r)' % obj.statement
+            if obj.wrap is not None:
+                expression = '%s(%s)' % (self.reference(obj.wrap), expression)
+        elif entry is not None and entry[0] is obj:
+            expression = '_resolve(%r)' % entry[1]
+        else:
+            module = getattr(obj, '__module__', None)
+            name = getattr(obj, '__qualname__',
+                           getattr(obj, '__name__', None))
+            statement = '%s:%s' % (module, name)
+            try:
+                found = resolver.resolve(statement)
+            except Exception:
+                found = None
+            if found is not obj:
+                raise ValueError("Can't name %r in a dispatch module." % obj)
+            expression = '_resolve(%r)' % statement
+        variable = self.name('h')
+        self.head.append('%s = %s' % (variable, expression))
+        self.names[key] = variable
+        return variable
+
+    def regex(self, pattern, kind):
+        """Return the name of a module variable holding a regex."""
+        key = (pattern, kind)
+        if key not in self.regexes:
+            self.regexes[key] = variable = self.name(kind)
+            self.head.append('%s = re.compile(%r)' % (variable, pattern))
+        return self.regexes[key]
+
+    def check(self, pattern):
+        """Return an expression telling whether `part` fits a type."""
+        if pattern == r'[^/]+':
+            return 'part'
+        if pattern == r'[^/^.]+':
+            return "part and '.' not in part and '^' not in part"
+        if pattern == r'\d+' and hasattr(str, 'isdecimal'):
+            return 'part.isdecimal()'
+        if pattern == r'[a-zA-Z]+' and hasattr(str, 'isascii'):
+            return 'part.isascii() and part.isalpha()'
+        return '%s.match(part)' % self.regex(r'(?:%s)\Z' % pattern, 't')
+
+    def node(self, node, depth):
+        """Write a function for a tree node and return its name."""
+        children, leaves = node
+        name = self.name('n')
+        body = []
+        literals = [(spec[1], child) for spec, child in children.items()
+                    if spec[0] == 'literal']
+        if children:
+            body.append('part = parts[%s]' % depth)
+        if len(literals) > 2:
+            table = self.name('d')
+            self.tables.append('%s = {%s}' % (table, ', '.join(
+                '%r: %s' % (text, self.node(child, depth + 1))
+                for text, child in literals)))
+            body.extend(['child = %s.get(part)' % table,
+                         'if child is not None:',
+                         '    child(parts, path, found)'])
+        else:
+            for i, (text, child) in enumerate(literals):
+                body.extend(['%s part == %r:' % (i and 'elif' or 'if', text),
+                             '    %s(parts, path, found)' %
+                             self.node(child, depth + 1)])
+        for spec, child in children.items():
+            if spec[0] == 'capture':
+                test = self.check(spec[1])
+            elif spec[0] == 'regex':
+                test = '%s.match(part)' % self.regex(spec[1], 's')
+            else:
+                continue
+            body.extend(['if %s:' % test,
+                         '    %s(parts, path, found)' %
+                         self.node(child, depth + 1)])
+        for index, svars, updates in leaves:
+            items = ', '.join('%r: %s' % item for item in svars)
+            if updates:
+                body.append('svars = {%s}' % items)
+                body.extend('svars.update(%s.match(parts[%s]).groupdict())'
+                            % (self.regex(pattern, 's'), at)
+                            for pattern, at in updates)
+                body.append('found.append((%s, svars, path))' % index)
+            else:
+                body.append('found.append((%s, {%s}, path))' % (index, items))
+        self.functions.append('\n'.join(
+            ['def %s(parts, path, found):' % name] +
+            ['    ' + line for line in body]))
+        return name
+
+
+def _dispatch_segments(mapping):
+    """Split a mapping's expression into path segments for dispatch.
+
+    Returns a list of variants, each a list of segment specs:
+    ``('literal', text)``, ``('capture', pattern, name)`` for a capture
+    filling a segment or ``('regex', pattern, names)`` for anything
+    else. Returns None if the mapping's regex must be run instead.
+    """
+    tree = _tree(mapping)
+    pattern = getattr(mapping[0], 'pattern', None)
+    if tree is None or pattern is None:
+        return None
+    nodes, openended = tree
+    parser = mapping.parser
+    try:
+        if openended or pattern != '^%s$' % _render(nodes, parser.patterns):
+            return None
+        variants = _expand_optionals(nodes)
+    except (KeyError, ValueError, PathExpressionParserError):
+        return None
+    results = []
+    for variant in variants:
+        segments = [[]]
+        for node in variant:
+            if node[0] == 'literal':
+                pieces = node[1].split('/')
+                segments[-1].append(pieces[0])
+                segments.extend([piece] for piece in pieces[1:])
+            elif parser.patterns[node[2]] in _segment_patterns:
+                segments[-1].append((node[1], parser.patterns[node[2]]))
+            else:
+                return None
+        specs = []
+        for segment in segments:
+            bits = [bit for bit in segment if bit != '']
+            if not bits:
+                specs.append(('literal', ''))
+            elif len(bits) == 1 and not isinstance(bits[0], tuple):
+                specs.append(('literal', bits[0]))
+            elif len(bits) == 1:
+                specs.append(('capture', bits[0][1], bits[0][0]))
+            else:
+                specs.append(('regex', ''.join(
+                    '(?P<%s>%s)' % bit if isinstance(bit, tuple)
+                    else re.escape(bit) for bit in bits) + r'\Z',
+                    tuple(bit[0] for bit in bits if isinstance(bit, tuple))))
+        results.append(specs)
+    if len(set(len(specs) for specs in results)) != len(results):
+        # Two variants could match one path; let the regex choose.
+        return None
+    return results
+
+
+def dispatch_source(source):
+    """Return the source of a module that dispatches like a selector.
+
+    `source` is a `Selector` or the name of a mapping file. The module's
+    ``select(path, method)`` gives the same answers as `Selector.select`
+    without regexes for most routes: it branches on the path segments
+    with plain string tests. Routes it can't take apart (plain regexes,
+    open ended expressions, ``any`` and other types that may span
+    segments) still use their regexes, as does any path holding a
+    newline. Handlers are looked up with `resolver` when the module is
+    imported, from the mapping file statements they came from or by
+    module and name; a ValueError is raised for any that can't be named,
+    or for a `ChainSelector`.
+    """
+    if isinstance(source, ChainSelector):
+        raise ValueError("Can't write dispatch for a ChainSelector")
+    if isinstance(source, Selector):
+        selector, origin = source, 'a selector'
+        writer = _DispatchWriter({}, {})
+    else:
+        selector, origin = _Recorder(mapfile=source), source
+        writer = _DispatchWriter(selector.specs, selector.wrapped)
+    mappings = list(selector.mappings)
+    status = (writer.reference(selector.status404),
+              writer.reference(selector.status405))
+    trees = {}
+    fallback = []
+    methods, allowed, patterns, converters = [], [], [], []
+    for index, mapping in enumerate(mappings):
+        regex, method_dict = mapping
+        methods.append('{%s}' % ', '.join(
+            '%r: %s' % (meth, writer.reference(app))
+            for meth, app in method_dict.items()))
+        converters.append('(%s)' % ''.join(
+            '(%r, %s), ' % (name, writer.reference(convert))
+            for name, convert in getattr(mapping, 'converters', None) or ()))
+        allowed.append(repr(list(method_dict.keys())))
+        patterns.append('(%r, %r)' % (regex.pattern, regex.flags))
+        variants = _dispatch_segments(mapping)
+        if variants is None:
+            fallback.append('(%s, %s)' % (index, writer.regex(
+                regex.pattern, 'r')))
+            continue
+        names = []
+        for specs in variants:
+            for spec in specs:
+                if spec[0] == 'capture':
+                    names.append(spec[2])
+                elif spec[0] == 'regex':
+                    names.extend(spec[2])
+        for specs in variants:
+            node = trees.setdefault(len(specs), (OrderedDict(), []))
+            svars = dict((name, 'None') for name in names)
+            updates = []
+            for depth, spec in enumerate(specs):
+                if spec[0] == 'capture':
+                    svars[spec[2]] = 'parts[%s]' % depth
+                elif spec[0] == 'regex':
+                    updates.append((spec[1], depth))
+                node = node[0].setdefault(spec, (OrderedDict(), []))
+            node[1].append((index, sorted(svars.items()), updates))
+    lengths = ['%s: %s' % (length, writer.node(tree, 0))
+               for length, tree in sorted(trees.items())]
+    return '\n'.join([
+        '"""Dispatch for %s, written by `selector.dispatch_source`.' % origin,
+        '',
+        'Do not edit; write it again when the routes change.',
+        '"""',
+        '',
+        'import re',
+        'from operator import itemgetter',
+        '',
+        'from resolver import resolve as _resolve',
+        '',
+        ] + writer.head + [
+        '_status404, _status405 = %s, %s' % status,
+        '_methods = [%s]' % ',\n    '.join(methods),
+        '_allowed = [%s]' % ',\n    '.join(allowed),
+        '_patterns = [%s]' % ',\n    '.join(patterns),
+        '_converters = [%s]' % ',\n    '.join(converters),
+        '_fallback = [%s]' % ', '.join(fallback),
+        '', ''] + ['\n'.join([f, '', '']) for f in writer.functions] +
+        writer.tables + ['_lengths = {%s}' % ', '.join(lengths)]
+    ) + _dispatch_runtime
+
+
+def write_dispatch(source, filename):
+    """Write the `dispatch_source` module for source to a file."""
+    with open(filename, 'w') as the_file:
+        the_file.write(dispatch_source(source))
+
+
 class SimpleParser(object):
     """Callable to turn path expressions into regexes with named groups.
 
@@ -249,25 +3699,42 @@ class SimpleParser(object):
                  'chunk': r'[^/^.]+',
                  'segment': r'[^/]+',
                  'any': r'.+'}
+    _converters = {'digits': int,
+                   'number': float}
     default_pattern = 'chunk'
 
-    def __init__(self, patterns=None):
-        """Initialize with character class mappings."""
+    def __init__(self, patterns=None, safe=False, typed=False,
+                 converters=None):
+        """Initialize with character class mappings.
+
+        With `safe`, type patterns are made possessive where that can't
+        change what they match (see `_harden`), and path expressions
+        that couldn't be fully hardened are listed in `unsafe`.
+
+        With `typed`, captures of the ``digits`` and ``number`` types are
+        handed on as an int and a float. `converters` maps more type
+        names to callables. A converter raising ValueError makes the
+        route not match.
+        """
         self.patterns = dict(self._patterns)
         if patterns is not None:
             self.patterns.update(patterns)
+        self.converters = dict(self._converters) if typed else {}
+        if converters is not None:
+            self.converters.update(converters)
+        self.safe = safe
+        self.unsafe = []
 
-    def _lookup(self, name):
-        """Return the replacement for the name found."""
-        if ':' in name:
-            name, pattern = name.split(':')
-            pattern = self.patterns[pattern]
-        else:
-            pattern = self.patterns[self.default_pattern]
-        if name == '':
-            name = '__pos%s' % self._pos
-            self._pos += 1
-        return '(?P<%s>%s)' % (name, pattern)
+    def cache_key(self):
+        """Return what decides the regexes made, for `compile_cache`.
+
+        Returns None in safe mode, so every expression gets checked and
+        reported in `unsafe`.
+        """
+        if self.safe:
+            return None
+        return (self.__class__, self.start, self.end, self.ostart, self.oend,
+                self.default_pattern, tuple(sorted(self.patterns.items())))
 
     def _lastly(self, regex):
         """Process the result of __call__ right before it returns.
@@ -284,57 +3751,163 @@ class SimpleParser(object):
         """
         return "^%s" % regex
 
-    def _outermost_optionals_split(self, text):
-        """Split out optional portions by outermost matching delims."""
-        parts = []
-        buffer = ""
-        starts = ends = 0
-        for c in text:
-            if c == self.ostart:
-                if starts == 0:
-                    parts.append(buffer)
-                    buffer = ""
-                else:
-                    buffer += c
-                starts += 1
-            elif c == self.oend:
-                ends += 1
-                if starts == ends:
-                    parts.append(buffer)
-                    buffer = ""
-                    starts = ends = 0
-                else:
-                    buffer += c
+    def _tokens(self, text, delimiters):
+        """Split text into runs of plain text and single delimiters."""
+        delimiters = re.escape(delimiters)
+        return re.findall('[^%s]+|[%s]' % (delimiters, delimiters), text)
+
+    def _capture(self, text, pos):
+        """Return the capture node for the text between braces.
+
+        Positional captures are named by the number `pos` of positional
+        captures before them.
+        """
+        if ':' in text:
+            name, pattern = text.split(':')
+        else:
+            name, pattern = text, self.default_pattern
+        if name == '':
+            name = '__pos%s' % pos
+        return ('capture', name, pattern)
+
+    def parse(self, url_pattern):
+        """Take a path expression apart in one pass.
+
+        Returns ``(nodes, openended)``, where each node is one of
+        ``('literal', text)``, ``('capture', group_name, type_name)`` or
+        ``('optional', nodes)``. Positional captures get the group names
+        the regex would give them. Each brace switches between literal
+        text and a capture, starting over with literal text at each
+        optional delimiter.
+        """
+        openended = url_pattern.endswith('|')
+        if openended:
+            url_pattern = url_pattern[:-1]
+        braces = (self.start, self.end)
+        if self.ostart in url_pattern:
+            brackets = (self.ostart, self.oend)
+        else:
+            # Without an opening delimiter, closing ones are plain text.
+            brackets = ()
+        nodes, outer = [], []
+        capture = None
+        pos = 0
+        for token in self._tokens(url_pattern, ''.join(braces + brackets)):
+            if capture is not None and (token in braces or
+                                        token in brackets):
+                nodes.append(self._capture(capture, pos))
+                if capture == '' or capture.startswith(':'):
+                    pos += 1
+                if token in braces:
+                    capture = None
+                    continue
+                capture = None
+            if token in braces:
+                capture = ''
+            elif token in brackets and token == self.ostart:
+                outer.append(nodes)
+                nodes = []
+            elif token in brackets:
+                if not outer:
+                    raise PathExpressionParserError(
+                        "Mismatch of optional portion delimiters."
+                    )
+                inner, nodes = nodes, outer.pop()
+                nodes.append(('optional', inner))
+            elif capture is None:
+                nodes.append(('literal', token))
             else:
-                buffer += c
-        if not starts == ends == 0:
+                capture = token
+        if capture is not None:
+            nodes.append(self._capture(capture, pos))
+        if outer:
             raise PathExpressionParserError(
                 "Mismatch of optional portion delimiters."
             )
-        parts.append(buffer)
-        return parts
-
-    def _parse(self, text):
-        """Turn a path expression into regex."""
-        if self.ostart in text:
-            parts = self._outermost_optionals_split(text)
-            parts = list(map(self._parse, parts))
-            parts[1::2] = ["(%s)?" % p for p in parts[1::2]]
-        else:
-            parts = [part.split(self.end)
-                     for part in text.split(self.start)]
-            parts = [y for x in parts for y in x]
-            parts[::2] = list(map(re.escape, parts[::2]))
-            parts[1::2] = list(map(self._lookup, parts[1::2]))
-        return ''.join(parts)
+        return nodes, openended
+
+    def render(self, nodes):
+        """Render `parse` nodes as a regex, without anchors."""
+        return _render(nodes, self.patterns)
+
+    def _harden(self, nodes, after):
+        """Render parse tree nodes as a regex with possessive types.
+
+        `after` lists what may come next: literal characters as
+        ``('char', c)``, anything else as ``('class', atom)`` and the end
+        of the regex as None. A quantified atom only gives back characters
+        if what follows needs them, so when nothing that can follow
+        matches the atom it is made possessive, and matches the same.
+        Returns the regex, what the nodes may start with and whether
+        every quantified atom was hardened.
+        """
+        parts, safe = [], True
+        for node in reversed(nodes):
+            if node[0] == 'literal':
+                parts.append(re.escape(node[1]))
+                after = [('char', node[1][0])]
+            elif node[0] == 'capture':
+                pattern = self.patterns[node[2]]
+                try:
+                    atoms = _atoms(pattern)
+                except ValueError:
+                    atoms = None
+                if atoms is None or ''.join(map(''.join, atoms)) != pattern:
+                    parts.append('(?P<%s>%s)' % (node[1], pattern))
+                    after = [('class', None)]
+                    safe = False
+                    continue
+                rendered = []
+                for atom, quantifier in reversed(atoms):
+                    if quantifier:
+                        test = re.compile(atom)
+                        if _possessive and all(
+                                follow is None or (follow[0] == 'char' and
+                                                   not test.match(follow[1]))
+                                for follow in after):
+                            quantifier += '+'
+                        else:
+                            safe = False
+                    rendered.insert(0, atom + quantifier)
+                    if len(atom) == 1 and atom != '.':
+                        first = ('char', atom)
+                    else:
+                        first = ('class', atom)
+                    if quantifier[:1] in ('*', '?'):
+                        after = [first] + after
+                    else:
+                        after = [first]
+                parts.append('(?P<%s>%s)' % (node[1], ''.join(rendered)))
+            else:
+                inner, first, inner_safe = self._harden(node[1], after)
+                parts.append('(%s)?' % inner)
+                after = first + after
+                safe = safe and inner_safe
+        return ''.join(reversed(parts)), after, safe
 
     def __call__(self, url_pattern):
         """Turn a path expression into a regex."""
-        self._pos = 0
-        if url_pattern.endswith('|'):
-            return self._openended(self._parse(url_pattern[:-1]))
+        nodes, openended = self.parse(url_pattern)
+        return self.from_tree(nodes, openended, url_pattern)
+
+    def from_tree(self, nodes, openended, url_pattern):
+        """Turn the `parse` of the path expression url_pattern into a regex.
+
+        Selectors call this instead of parsing again (see `_compile`),
+        unless a subclass has its own `__call__`.
+        """
+        if self.safe:
+            regex, first, safe = self._harden(nodes, [None])
+            if not safe and url_pattern not in self.unsafe:
+                self.unsafe.append(url_pattern)
         else:
-            return self._lastly(self._parse(url_pattern))
+            regex = self.render(nodes)
+        if openended:
+            return self._openended(regex)
+        return self._lastly(regex)
+
+
+_simple_call = SimpleParser.__dict__['__call__']
 
 
 class EnvironDispatcher(object):
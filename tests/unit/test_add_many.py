@@ -0,0 +1,116 @@
+"""Unit test adding mappings in bulk."""
+
+import re
+
+import selector
+
+routes = [('/users/{name}[/]', {'GET': 1}),
+          ('/healthz', {'GET': 2}),
+          ('/users/{name}[/]', {'POST': 3}),
+          ('/posts/{id:digits}', {'GET': 4}),
+          ('/users/{name}/x', {'PUT': 5}),
+          ('/users/{name}[/]', {'PUT': 6})]
+
+
+def _table(s):
+    return [(m.expression, m[0].pattern, m[1]) for m in s.mappings]
+
+
+def test_add_many_matches_add():
+    """The table is the same as from adding one at a time."""
+    one = selector.Selector()
+    for path, methods in routes:
+        one.add(path, methods)
+    many = selector.Selector()
+    many.add_many(iter(routes))
+    assert _table(many) == _table(one)
+    assert len(many.mappings) == 4
+    for path in ('/users/bob', '/users/bob/x', '/healthz', '/posts/1'):
+        for method in ('GET', 'POST', 'PUT'):
+            assert many.select(path, method) == one.select(path, method)
+
+
+def test_regexes_compiled_when_used():
+    """Regexes are compiled on first use, or by warmup."""
+    selector.compile_cache.clear()
+    s = selector.Selector()
+    s.add_many([('/healthz', {'GET': 1}), ('/a/{x}', {'GET': 2}),
+                ('/b/{x}', {'GET': 3}, '/v1', 'b')])
+    regexes = [m[0] for m in s.mappings]
+    assert all(isinstance(r, selector._DeferredRegex) for r in regexes)
+    assert s.url_for('b', x='y') == '/v1/b/y'
+    assert s.select('/a/q', 'GET')[0] == 2
+    assert ['compiled' in r.__dict__ for r in regexes] == [False, True, False]
+    assert s.warmup(freeze_gc=False)['compiled'] == 2
+    assert s.select('/v1/b/q', 'GET')[:2] == (3, {'x': 'q'})
+    assert regexes[2].groups == 1
+
+
+def test_add_many_all_or_nothing():
+    """If an item fails, nothing is added."""
+    s = selector.Selector()
+    s.add('/a', GET=1)
+
+    def broken():
+        yield ('/b', {'GET': 2})
+        raise ValueError('bad route')
+    try:
+        s.add_many(broken())
+    except ValueError:
+        pass
+    assert [m.expression for m in s.mappings] == ['/a']
+    assert s._pending is None
+    assert s.select('/a', 'GET')[0] == 1
+    try:
+        s.add_many([('/c', {'GET': 3}, None, 'c'), ('/d[', {'GET': 4})])
+    except selector.PathExpressionParserError:
+        pass
+    assert [m.expression for m in s.mappings] == ['/a']
+    assert s.named == {}
+    assert s.select('/c', 'GET')[0] is s.status404
+
+
+def test_add_many_bad_regex():
+    """A regex that won't compile fails the lot, and is named."""
+    s = selector.Selector()
+    s.add('/a', GET=1)
+    s.parser = selector.SimpleParser(patterns={'bad': '(a'})
+    try:
+        s.add_many([('/b', {'GET': 2}), ('/c/{x:bad}', {'GET': 3})])
+    except re.error as error:
+        assert '(a' in str(error)
+    else:
+        assert False, 'no error'
+    assert [m.expression for m in s.mappings] == ['/a']
+    assert s.select('/a', 'GET')[0] == 1
+    assert s.select('/zzz', 'GET')[0] is s.status404
+
+
+def test_bulk_slurp_file(tmpdir):
+    """Mapping files can be read in bulk."""
+    filename = str(tmpdir.join('app.urls'))
+    with open(filename, 'w') as the_file:
+        the_file.write('/a/{x}\n    GET selector:expose\n'
+                       '@prefix /p\n/b\n    GET selector:not_found\n'
+                       '/a/{x}\n    POST selector:expose\n')
+    selector.compile_cache.clear()
+    bulk = selector.Selector()
+    bulk.slurp_file(filename, bulk=True)
+    plain = selector.Selector(mapfile=filename)
+    assert _table(bulk) == _table(plain)
+    assert isinstance(bulk.mappings[0][0], selector._DeferredRegex)
+
+
+def test_merge_after_changes_in_place():
+    """Merging still finds the right mapping after the list changes."""
+    s = selector.Selector()
+    s.add('/a', GET=1)
+    s.add('/b', GET=2)
+    s.mappings.reverse()
+    s.invalidate()
+    s.add('/a', POST=3)
+    assert [m.expression for m in s.mappings] == ['/b', '/a']
+    assert s.mappings[1][1] == {'GET': 1, 'POST': 3}
+    s.mappings.append(selector.Mapping(s.mappings[0][0], {'PUT': 4}))
+    s.add('/b', DELETE=5)
+    assert s.mappings[2][1] == {'PUT': 4, 'DELETE': 5}
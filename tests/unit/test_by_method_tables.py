@@ -0,0 +1,50 @@
+"""Unit test per HTTP method tables and the 405 ``Allow`` union."""
+
+import selector
+
+routes = [
+    ('/items/{id}', {'DELETE': 1}),
+    ('/items/{id}', {'PUT': 2}),
+    ('/items/new', {'GET': 3}),
+    ('/items/{id}', {'GET': 4, 'POST': 5}),
+    ('/any/{x}', {'_ANY_': 6}),
+]
+
+
+class Unmerged(selector.Selector):
+    merge_methods = False
+
+
+def test_405_allows_every_matching_mapping():
+    """The 405 methods are the union over all mappings matching path."""
+    s = Unmerged(mappings=[routes[0], routes[1]])
+    app, svars, methods, matched = s.select('/items/3', 'GET')
+    assert app is s.status405
+    assert methods == ['DELETE', 'PUT']
+    app, svars, methods, matched = s.freeze() and s.select('/items/3', 'GET')
+    assert methods == ('DELETE', 'PUT')
+    assert methods.header == 'DELETE, PUT'
+
+
+def test_by_method_agrees_with_scan():
+    """Method tables give the same answers as one table."""
+    plain = Unmerged(mappings=routes)
+    split = Unmerged(mappings=routes, by_method=True)
+    for path in ('/items/3', '/items/new', '/any/x', '/nope'):
+        for method in ('GET', 'POST', 'PUT', 'DELETE', 'PATCH'):
+            assert split.select(path, method) == plain.select(path, method)
+    split.freeze()
+    methods = split.select('/items/3', 'PATCH')[2]
+    assert methods[:2] == ('DELETE', 'PUT')
+    assert set(methods[2:]) == set(['GET', 'POST'])
+
+
+def test_method_tables():
+    """Each table holds the mappings taking its method or ``_ANY_``."""
+    s = Unmerged(mappings=routes, by_method=True)
+    s.select('/', 'GET')
+    tables = s._matcher.method_tables
+    assert set(tables) == set([None, 'DELETE', 'GET', 'POST', 'PUT'])
+    assert tables['GET'][1] == [2, 3, 4]
+    assert tables[None][1] == [4]
+    assert s._method_table(s._matcher, 'PATCH') is tables[None]
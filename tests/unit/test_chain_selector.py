@@ -0,0 +1,103 @@
+"""Unit test `ChainSelector`."""
+
+import pytest
+
+import selector
+
+
+def _chain(**kwargs):
+    s1 = selector.Selector()
+    s1.add('/a/{name}', GET=1)
+    s1.add('/a/{name}', POST=2)
+    s2 = selector.Selector()
+    s2.add('/a/{name}', PUT=3)
+    s2.add('/b[/]', GET=4)
+    s2.status405 = 'no'
+    s3 = selector.Selector()
+    s3.add('/{page}', GET=5)
+    s3.status404 = 'missing'
+    s1.status404 = s2
+    s2.status404 = s3
+    return s1, selector.ChainSelector(s1, **kwargs)
+
+
+def test_chain_answers_like_the_links():
+    """Each selector answers for the paths it matches, 405 and all."""
+    s1, chain = _chain()
+    assert chain.chain == [s1, s1.status404, s1.status404.status404]
+    assert chain.bounds == [1, 3]
+    assert chain.select('/a/x', 'POST')[:2] == (2, {'name': 'x'})
+    app, svars, methods, matched = chain.select('/a/x', 'PUT')
+    assert (app, svars, sorted(methods)) == (s1.status405, {},
+                                             ['GET', 'POST'])
+    assert chain.select('/b', 'POST')[:3] == ('no', {}, ['GET'])
+    assert chain.select('/b/', 'GET')[0] == 4
+    assert chain.select('/c', 'GET')[0] == 5
+    assert chain.select('/c/d', 'GET')[0] == 'missing'
+
+
+def _answer(found):
+    return found[0], found[1], sorted(found[2])
+
+
+@pytest.mark.parametrize('matcher', [selector.LinearMatcher,
+                                     selector.CombinedMatcher,
+                                     selector.TrieMatcher])
+def test_chain_with_matchers_and_freezing(matcher):
+    """Other matchers, the cache, a frozen table and `by_method` agree."""
+    plain = _chain()[1]
+    for kwargs in ({}, {'by_method': True}):
+        s1, chain = _chain(matcher=matcher, cache_size=10, **kwargs)
+        chain.freeze()
+        for path in ('/a/x', '/b', '/c', '/c/d'):
+            for method in ('GET', 'POST', 'PUT'):
+                found = chain.select(path, method)
+                assert isinstance(found[2], tuple)
+                assert _answer(found) == _answer(plain.select(path, method))
+
+
+def test_chain_by_method():
+    """Per-method tables stop at the selector the chain would."""
+    s1, chain = _chain(by_method=True)
+    plain = _chain()[1]
+    for path in ('/a/x', '/b', '/b/', '/c', '/c/d'):
+        for method in ('GET', 'POST', 'PUT', 'DELETE'):
+            assert chain.select(path, method) == plain.select(path, method)
+    assert 'PUT' in chain._matcher.method_tables
+    s1.by_method = True
+    assert selector.ChainSelector(s1).by_method
+
+
+def test_chain_call_and_chunks():
+    """Calling and `select_many` stop at the same selector."""
+    s1, chain = _chain()
+    chain.add('/z/y', GET=lambda environ, start_response: [
+        environ['SCRIPT_NAME'], environ['PATH_INFO']])
+    environ = {'PATH_INFO': '/z/y', 'REQUEST_METHOD': 'GET'}
+    assert chain(environ, None) == ['/z/y', '']
+    assert chain.select_many(['/a/x', '/b', '/c'], ['PUT', 'GET', 'GET'])[0] \
+        == [-1, 2, 3]
+
+
+def test_chain_with_mappings():
+    """Mappings given to the chain selector go with the last selector."""
+    s1, chain = _chain(mappings=[('/c/d', {'GET': 6})])
+    assert chain.bounds == [1, 3]
+    assert len(chain.mappings) == 5
+    assert chain.select('/c/d', 'GET')[0] == 6
+    assert chain.select('/c/d', 'POST')[0] == s1.status404.status404.status405
+    assert chain.select('/a/x', 'GET')[0] == 1
+
+
+def test_chain_rejects_what_it_cannot_keep():
+    """Mixed path consumption, reordering and dispatch modules fail."""
+    s1, chain = _chain()
+    with pytest.raises(TypeError):
+        chain.reorder({})
+    with pytest.raises(ValueError):
+        selector.dispatch_source(chain)
+    s1.status404.consume_path = False
+    with pytest.raises(ValueError):
+        selector.ChainSelector(s1)
+    s1.status404 = s1
+    assert selector.ChainSelector(s1).chain == [s1]
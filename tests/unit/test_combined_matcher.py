@@ -0,0 +1,59 @@
+"""Unit test `CombinedMatcher`."""
+
+import re
+
+import selector
+
+
+def _selector(routes, parser=None):
+    s = selector.Selector(parser=parser, matcher=selector.CombinedMatcher)
+    for path, methods in routes:
+        s.add(path, methods)
+    return s
+
+
+def test_combined_first_match():
+    """The first matching mapping wins, as with a linear scan."""
+    s = _selector([('/a/{name}', {'GET': 1}),
+                   ('/a/{name}[/]', {'GET': 2}),
+                   ('/b/{:digits}', {'GET': 3})])
+    assert s.select('/a/bob', 'GET') == (1, {'name': 'bob'}, ['GET'], '/a/bob')
+    assert s.select('/a/bob/', 'GET')[0] == 2
+    assert s.select('/b/12', 'GET') == (3, {'__pos0': '12'}, ['GET'], '/b/12')
+    assert s.select('/c', 'GET')[0] is s.status404
+
+
+def test_combined_falls_through_on_method():
+    """A mapping lacking the method lets later mappings match."""
+    s = _selector([('/ws/{slug}', {'GET': 1}),
+                   ('/ws/{slug}', {'POST': 2})])
+    assert s.select('/ws/x', 'POST')[0] == 2
+    app, svars, methods, matched = s.select('/ws/x', 'PUT')
+    assert app is s.status405
+
+
+def test_combined_with_unanchored_regexes():
+    """Regexes that may match anywhere are tried in table order."""
+    s = _selector([(r'^\/x\/(?P<n>\d+)$', {'GET': 1}),
+                   (r'foo', {'GET': 2}),
+                   (r'^\/a\/foo$', {'GET': 3}),
+                   (r'^\/(?P<w>a)\/(?P=w)$', {'GET': 4})],
+                  parser=lambda x: x)
+    matcher = selector.CombinedMatcher(s.mappings)
+    assert [c[0] is None for c in matcher.chunks] == [False, True, False,
+                                                      True]
+    assert s.select('/x/5', 'GET')[:2] == (1, {'n': '5'})
+    assert s.select('/a/foo', 'GET')[0] == 2
+    assert s.select('/a/a', 'GET')[0] == 4
+
+
+def test_combined_agrees_with_linear():
+    """Large tables are split into several alternations."""
+    routes = [('/r%s/{a}/{b}[/]' % i, {'GET': i}) for i in range(300)]
+    s = _selector(routes)
+    assert len(selector.CombinedMatcher(s.mappings).chunks) > 1
+    linear = selector.Selector(mappings=routes)
+    for i in (0, 57, 299):
+        path = '/r%s/x/y/' % i
+        assert s.select(path, 'GET') == linear.select(path, 'GET')
+    assert re.compile(s.mappings[0][0].pattern).groups == 3
@@ -0,0 +1,70 @@
+"""Unit test sharing compiled regexes between selectors."""
+
+import re
+
+import pytest
+
+import selector
+
+
+def test_selectors_share_regexes():
+    """The same expression and parser give the same compiled regex."""
+    one = selector.Selector(prefix='/t1')
+    two = selector.Selector()
+    a = one.add('/users/{name}', GET=1)
+    b = two.add('/t1/users/{name}', GET=2)
+    assert a[0] is b[0]
+    c = two.add('/t2/users/{name}', GET=3)
+    assert c[0] is not a[0]
+    other = selector.Selector(parser=selector.SimpleParser(
+        patterns={'chunk': r'\w+'}))
+    assert other.add('/t1/users/{name}', GET=4)[0] is not a[0]
+    assert other.select('/t1/users/bob', 'GET')[0] == 4
+
+
+def test_cache_keys():
+    """Parsers are keyed by what they make; safe ones aren't kept."""
+    assert selector.SimpleParser().cache_key() == \
+        selector.SimpleParser().cache_key()
+    assert selector.SimpleParser(safe=True).cache_key() is None
+    parser = selector.SimpleParser(safe=True)
+    selector.Selector(parser=parser).add('/{x:any}/y', GET=1)
+    selector.Selector(parser=parser).add('/{x:any}/y', GET=1)
+    assert parser.unsafe == ['/{x:any}/y']
+
+
+def test_cache_by_parser_identity():
+    """Other parsers are keyed by themselves."""
+    calls = []
+
+    def parser(expression):
+        calls.append(expression)
+        return expression
+    for i in range(2):
+        selector.Selector(parser=parser).add('^/raw$', GET=1)
+    assert calls == ['^/raw$']
+    old = selector.compile_cache
+    selector.compile_cache = None
+    try:
+        selector.Selector(parser=parser).add('^/raw$', GET=1)
+    finally:
+        selector.compile_cache = old
+    assert calls == ['^/raw$', '^/raw$']
+
+
+def test_deferred_regexes_not_shared():
+    """Regexes left for later aren't handed to selectors adding now."""
+    selector.compile_cache.clear()
+    parser = str
+    bulk = selector.Selector(parser=parser)
+    with pytest.raises(re.error):
+        bulk.add_many([('^/b($', {'GET': 1}), ('^/c$', {'GET': 2})])
+    bulk.add_many([('^/c$', {'GET': 2})])
+    assert isinstance(bulk.mappings[0][0], selector._DeferredRegex)
+    s = selector.Selector(parser=parser)
+    with pytest.raises(re.error):
+        s.add('^/b($', GET=1)
+    assert s.add('^/c$', GET=2)[0].__class__ is re.compile('').__class__
+    again = selector.Selector(parser=parser)
+    again.add_many([('^/c$', {'GET': 3})])
+    assert again.mappings[0][0] is s.mappings[0][0]
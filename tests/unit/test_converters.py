@@ -0,0 +1,68 @@
+"""Unit test converting captures with typed parsers."""
+
+import selector
+
+
+def _selector(**kwargs):
+    return selector.Selector(parser=selector.SimpleParser(typed=True),
+                             **kwargs)
+
+
+def test_typed_captures_are_converted():
+    """Digits become ints and numbers floats; other types stay text."""
+    s = _selector()
+    s.add('/items/{id:digits}/{price:number}/{slug}', GET=1)
+    s.add('/pages/{:digits}[/{n:digits}]', GET=2)
+    assert s.mappings[0].converters == (('id', int), ('price', float))
+    assert s.select('/items/12/3.5/x', 'GET') == (
+        1, {'id': 12, 'price': 3.5, 'slug': 'x'}, ['GET'], '/items/12/3.5/x')
+    assert s.select('/pages/7', 'GET')[1] == {'__pos0': 7, 'n': None}
+    assert s.select('/pages/7/8', 'GET')[1] == {'__pos0': 7, 'n': 8}
+    assert selector.Selector().add('/{id:digits}').converters == ()
+
+
+def test_failed_conversion_falls_through():
+    """A converter raising ValueError makes the mapping not match."""
+    def even(text):
+        if int(text) % 2:
+            raise ValueError(text)
+        return int(text)
+    parser = selector.SimpleParser(converters={'digits': even})
+    s = selector.Selector(parser=parser)
+    s.add('/n/{n:digits}', GET=1)
+    s.add('/n/{n}', POST=2)
+    s.add('/n/{n}', GET=3)
+    assert s.select('/n/4', 'GET')[:2] == (1, {'n': 4})
+    assert s.select('/n/5', 'GET')[:2] == (3, {'n': '5'})
+    s = selector.Selector(parser=parser)
+    s.add('/n/{n:digits}', GET=1)
+    s.add('/m/{n:digits}', GET=1)
+    assert s.select('/n/5', 'GET')[0] is s.status404
+    for matcher in (selector.CombinedMatcher, selector.DfaMatcher,
+                    selector.TrieMatcher, selector.PruningMatcher):
+        s.matcher = matcher
+        s.invalidate()
+        assert s.select('/n/5', 'GET')[0] is s.status404
+        assert s.select('/n/6', 'GET')[:2] == (1, {'n': 6})
+
+
+def test_frozen_and_by_method_tables_convert():
+    """Frozen routes and method tables convert too."""
+    for s in (_selector(), _selector(by_method=True)):
+        s.add('/a/{id:digits}', GET=1)
+        s.add('/a/{id}', POST=2)
+        assert s.select('/a/1', 'POST')[:2] == (2, {'id': '1'})
+        s.freeze()
+        assert s.select('/a/1', 'GET')[:2] == (1, {'id': 1})
+        assert s.select('/a/1', 'PUT')[0] is s.status405
+
+
+def test_routing_args_are_converted():
+    """Handlers get the converted values."""
+    def app(environ, start_response):
+        return environ['wsgiorg.routing_args']
+    s = _selector()
+    s.add('/a/{:digits}/{x:number}', GET=app)
+    environ = {'PATH_INFO': '/a/3/1.5', 'REQUEST_METHOD': 'GET'}
+    assert s(environ, None) == ([3], {'x': 1.5})
+    assert environ['selector.vars'] == {'0': 3, 'x': 1.5}
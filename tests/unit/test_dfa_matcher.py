@@ -0,0 +1,72 @@
+"""Unit test `DfaMatcher`."""
+
+import selector
+
+
+def _both(routes, raw=()):
+    dfa = selector.Selector(matcher=selector.DfaMatcher)
+    linear = selector.Selector()
+    for s in (dfa, linear):
+        for path in routes:
+            s.add(path, GET=path)
+        s.parser = lambda x: x
+        for regex in raw:
+            s.add(regex, GET=regex)
+    return dfa, linear
+
+
+def test_dfa_agrees_with_re():
+    """Mappings, groups and matched text are the same as with `re`."""
+    dfa, linear = _both(['/a/{name}', '/a/{name}[/]', '/b/{:digits}',
+                         '/n/{x:number}/{y:any}', '/files/{p:any}|',
+                         '/s/{s:segment}[/{t:segment}[/{u}]]', '/x|', ''],
+                        [r'^\/raw\/(?P<r>\d+)$'])
+    matcher = selector.DfaMatcher(dfa.mappings)
+    assert sorted(matcher.programs) == list(range(8))
+    assert matcher.fallback == [8]
+    for path in ['/a/bob', '/a/bob/', '/a/b.c', '/b/12', '/b/1x',
+                 '/n/1.5/x/y', '/n/.5/', '/files/a/b', '/files/', '/x/y',
+                 '/s/a', '/s/a/b/c', '/s/a/b/c.d', '/raw/7', '', '/a/bob\n',
+                 '/files/a\nb', '/s/a\n\n', u'/a/\xe9']:
+        for method in ('GET', 'PUT'):
+            assert dfa.select(path, method) == linear.select(path, method)
+        assert [(i, m.groupdict(), m.group(0)) for i, m in
+                matcher.matches(path)] == \
+            [(i, m.groupdict(), m.group(0)) for i, m in
+             selector.LinearMatcher(dfa.mappings).matches(path)]
+
+
+def test_dfa_hostile_path():
+    """Types that make `re` backtrack are read in one pass."""
+    dfa, linear = _both(['/n/{x:number}{y:number}{z:number}/{w:any}'])
+    path = '/n/' + '1' * 5000 + 'x'
+    assert dfa.select(path, 'GET')[0] is dfa.status404
+    assert dfa.select('/n/12.5/x', 'GET') == \
+        linear.select('/n/12.5/x', 'GET')
+
+
+def test_dfa_state_limit():
+    """States are dropped and rebuilt past `max_states`."""
+    class Small(selector.DfaMatcher):
+        max_states = 3
+    s = selector.Selector(matcher=Small)
+    s.add('/a/{b}/c', GET=1)
+    assert s.select('/a/bbb/c', 'GET') == (1, {'b': 'bbb'}, ['GET'],
+                                           '/a/bbb/c')
+    assert s._matcher.flushes > 0
+    assert len(s._matcher.states) <= 3
+
+
+def test_atoms():
+    """Type patterns are split into quantified atoms or refused."""
+    assert selector._atoms(r'\d*.?\d+') == [(r'\d', '*'), ('.', '?'),
+                                            (r'\d', '+')]
+    assert selector._atoms(r'[^/^.]+') == [(r'[^/^.]', '+')]
+    assert selector._atoms(r'[]a]x') == [(r'[]a]', ''), ('x', '')]
+    for pattern in (r'a|b', r'(a)+', r'a{2}', r'a+?', r'\b', r'[a'):
+        try:
+            selector._atoms(pattern)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(pattern)
@@ -0,0 +1,92 @@
+"""Unit test writing dispatch modules with `dispatch_source`."""
+
+import os
+
+import selector
+
+urls = """\
+/healthz
+    GET selector:not_found
+/users/{name}[/]
+    GET selector:expose
+    POST selector:Naked()
+/users/{name}/posts/{id:digits}
+    GET selector:not_found
+/users/{name}/posts/{slug}.{ext:alpha}
+    GET selector:pliant
+/files/{path:any}
+    _ANY_ selector:opliant
+/a/x
+    GET selector:not_found
+/a/y
+    GET selector:not_found
+/a/z
+    GET selector:not_found
+/a/{w:word}
+    PUT selector:not_found
+@wrap selector:pliant
+/wrapped/{x}
+    GET selector:not_found
+"""
+
+paths = ['/healthz', '/users/bob', '/users/bob/', '/users/bob/posts/12',
+         '/users/bob/posts/a.b', '/users/bob/posts/a.b1', '/files/a/b',
+         '/a/x', '/a/q', '/a/', '/nope', '/users/bob\n', '', '/users/b.c',
+         '/wrapped/1']
+
+
+def _load(source):
+    namespace = {}
+    exec(compile(source, 'dispatch', 'exec'), namespace)
+    return namespace['select']
+
+
+def test_dispatch_from_file(tmpdir):
+    """The module answers like a selector reading the same file."""
+    filename = str(tmpdir.join('app.urls'))
+    with open(filename, 'w') as the_file:
+        the_file.write(urls)
+    source = selector.dispatch_source(filename)
+    assert 'part ==' in source and 'selector:expose' in source
+    select = _load(source)
+    s = selector.Selector(mapfile=filename)
+    for path in paths:
+        for method in ('GET', 'POST', 'PUT'):
+            mine, theirs = select(path, method), s.select(path, method)
+            assert mine[1:] == theirs[1:]
+            assert mine[0] is theirs[0] or \
+                isinstance(mine[0], selector.Naked) or \
+                mine[0].__name__ == 'wsgi_func'
+    out = str(tmpdir.join('dispatch.py'))
+    selector.write_dispatch(filename, out)
+    assert os.path.exists(out)
+
+
+def test_dispatch_from_selector():
+    """Handlers of a selector are named by module and name."""
+    s = selector.Selector()
+    s.add('/a/{n:digits}', GET=selector.not_found)
+    s.parser = lambda x: x
+    s.add(r'^\/raw$', POST=selector.expose)
+    select = _load(selector.dispatch_source(s))
+    assert select('/a/7', 'GET') == s.select('/a/7', 'GET')
+    assert select('/raw', 'GET') == s.select('/raw', 'GET')
+    s.add(r'^\/x$', GET=lambda e, sr: [])
+    try:
+        selector.dispatch_source(s)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('named a lambda')
+
+
+def test_dispatch_converts():
+    """Typed captures are converted, and falls through when they fail."""
+    s = selector.Selector(parser=selector.SimpleParser(typed=True))
+    s.add('/p/{x:number}', GET=selector.not_found)
+    s.add('/p/{x}', GET=selector.expose)
+    select = _load(selector.dispatch_source(s))
+    for path in ('/p/1.5', '/p/1x5'):
+        assert select(path, 'GET') == s.select(path, 'GET')
+    assert select('/p/1.5', 'GET')[1] == {'x': 1.5}
+    assert select('/p/1x5', 'GET')[:2] == (selector.expose, {'x': '1x5'})
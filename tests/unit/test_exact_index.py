@@ -0,0 +1,69 @@
+"""Unit test the exact path index for literal mappings."""
+
+import selector
+
+
+def test_literal_paths():
+    """Literal regexes expand to the exact paths they match."""
+    parser = selector.SimpleParser()
+    assert selector._literal_paths(parser('/healthz')) == ('/healthz',)
+    assert selector._literal_paths(parser('/a[/b[/c]]')) == ('/a', '/a/b',
+                                                             '/a/b/c')
+    assert selector._literal_paths(parser('/a/{name}')) is None
+    assert selector._literal_paths(parser('/a|')) is None
+    assert selector._literal_paths(r'^\/a\$') is None
+    assert selector._literal_paths(r'^\/a?$') is None
+    assert selector._literal_paths(r'^\/a\d$') is None
+
+
+def test_add_indexes_literals():
+    """Literal mappings go in the index, the rest are scanned."""
+    s = selector.Selector()
+    s.add('/login[/]', GET=1)
+    s.add('/users/{name}', GET=2)
+    s.add('/healthz', GET=3)
+    matcher = selector.LinearMatcher(s.mappings)
+    assert matcher.exact == {'/login': [0], '/login/': [0], '/healthz': [2]}
+    assert matcher.dynamic == [1]
+    assert s.select('/login/', 'GET') == (1, {}, ['GET'], '/login/')
+    assert s.select('/healthz', 'GET')[0] == 3
+    assert s.select('/users/bob', 'GET')[0] == 2
+
+
+def test_earlier_regex_wins():
+    """A regex mapping added before a literal one still matches first."""
+    s = selector.Selector()
+    s.add('/{page}', GET=1)
+    s.add('/about', GET=2, POST=3)
+    assert s.select('/about', 'GET')[0] == 1
+    assert s.select('/about', 'POST')[0] == 3
+    assert s.select('/about\n', 'POST')[0] == 3
+
+
+def test_mappings_changed_in_place():
+    """Changing the mappings list after a select is seen by the next."""
+    s = selector.Selector()
+    s.add('/a', GET=1)
+    assert s.select('/b', 'GET')[0] == s.status404
+    s.mappings.append((selector.re.compile('^/b$'), {'GET': 2}))
+    assert s.select('/b', 'GET')[0] == 2
+    s.mappings[:] = s.mappings[1:]
+    assert s.select('/a', 'GET')[0] == s.status404
+    assert s.select('/b', 'GET')[0] == 2
+
+
+def test_candidates_in_table_order():
+    """Exact hits go in among the scanned mappings by index."""
+    s = selector.Selector()
+    s.add('/{a}', GET=1)
+    s.add('/x', POST=2)
+    s.add('/{a}/{b}', GET=3)
+    s.add('/x[/y]', PUT=4)
+    s.add('/{a}/{b}/{c}', GET=5)
+    matcher = selector.LinearMatcher(s.mappings)
+    assert list(matcher.candidates('/x')) == [0, 1, 2, 3, 4]
+    assert list(matcher.candidates('/x/y')) == [0, 2, 3, 4]
+    assert [entry[0] for entry in matcher.candidate_entries('/x')] == \
+        [0, 1, 2, 3, 4]
+    assert list(matcher.candidates('/z')) == [0, 2, 4]
+    assert s.select('/x', 'PUT')[0] == 4
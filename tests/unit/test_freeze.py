@@ -0,0 +1,57 @@
+"""Unit test `Selector.freeze()` and `RouteTable`."""
+
+import pytest
+
+import selector
+
+
+def _frozen():
+    s = selector.Selector()
+    s.add('/a/{x}', GET=1, POST=2)
+    s.add('/b', _ANY_=3)
+    s.add('/c', PUT=4)
+    return s, s.freeze()
+
+
+def test_freeze_builds_routes():
+    """Each mapping becomes a Route with its dispatch data ready."""
+    s, table = _frozen()
+    assert isinstance(table, selector.RouteTable)
+    assert s.mappings is table
+    route = table[0]
+    assert sorted(route.allowed) == ['GET', 'POST']
+    assert route.allow == route.allowed.header
+    assert route.expression == '/a/{x}'
+    assert not route.any and table[1].any
+    regex, methods = route
+    assert route[0] is regex and methods == {'GET': 1, 'POST': 2}
+    assert not hasattr(route, '__dict__')
+
+
+def test_frozen_select():
+    """Dispatch from a frozen table works as before."""
+    s, table = _frozen()
+    app, svars, methods, matched = s.select('/a/z', 'POST')
+    assert (app, svars, matched) == (2, {'x': 'z'}, '/a/z')
+    assert methods is table[0].allowed
+    assert s.select('/b', 'DELETE')[0] == 3
+    app, svars, methods, matched = s.select('/c', 'GET')
+    assert app is s.status405
+    assert methods.header == 'PUT'
+    assert s.select('/d', 'GET') == (s.status404, {}, (), '')
+
+
+def test_frozen_table_refuses_routes():
+    """Routes can't be added to a frozen selector."""
+    s, table = _frozen()
+    with pytest.raises(TypeError):
+        s.add('/d', GET=5)
+    assert s.freeze() is table
+
+
+def test_405_uses_ready_made_header():
+    """The default 405 app uses the header worked out at freeze time."""
+    headers = []
+    environ = {'selector.methods': selector.AllowedMethods(['GET', 'PUT'])}
+    selector.method_not_allowed(environ, lambda s, h: headers.extend(h))
+    assert ('Allow', 'GET, PUT') in headers
@@ -0,0 +1,104 @@
+"""Unit test resolving mapping file handlers lazily."""
+
+import sys
+
+import selector
+
+handlers = """\
+calls = []
+
+
+class App(object):
+    def __init__(self, name):
+        calls.append(name)
+        self.name = name
+
+    def __call__(self, environ, start_response, **kwargs):
+        return [self.name] + sorted(kwargs.values())
+"""
+
+urls = """\
+/a
+    GET lazyapps:App('a')
+    POST lazyapps:App('a')
+/b
+    GET lazyapps:App('b')
+@wrap selector:pliant
+/c/{x}
+    GET lazyapps:App('c')
+"""
+
+
+def _setup(tmpdir, monkeypatch):
+    tmpdir.join('lazyapps.py').write(handlers)
+    monkeypatch.syspath_prepend(str(tmpdir))
+    sys.modules.pop('lazyapps', None)
+    filename = str(tmpdir.join('app.urls'))
+    with open(filename, 'w') as the_file:
+        the_file.write(urls)
+    return filename
+
+
+def _call(s, path, method='GET'):
+    environ = {'PATH_INFO': path, 'REQUEST_METHOD': method}
+    return s(environ, None)
+
+
+def test_handlers_resolved_on_first_call(tmpdir, monkeypatch):
+    """Nothing is imported until a handler is called."""
+    filename = _setup(tmpdir, monkeypatch)
+    s = selector.Selector(mapfile=filename, lazy_handlers=True)
+    assert 'lazyapps' not in sys.modules
+    proxy = s.mappings[0][1]['GET']
+    assert isinstance(proxy, selector.LazyHandler)
+    assert _call(s, '/a') == ['a']
+    calls = sys.modules['lazyapps'].calls
+    assert calls == ['a']
+    assert s.mappings[0][1]['GET'] is proxy.target
+    assert _call(s, '/a', 'POST') == ['a']
+    assert calls == ['a']
+    assert s.mappings[0][1]['POST'] is proxy.target
+    assert isinstance(s.mappings[1][1]['GET'], selector.LazyHandler)
+    assert _call(s, '/c/x') == ['c', 'x']
+    assert s.mappings[2][1]['GET'].__name__ == 'wsgi_func'
+    assert calls == ['a', 'c']
+
+
+def test_lazy_handlers_in_frozen_table(tmpdir, monkeypatch):
+    """Proxies replace themselves in frozen routes too."""
+    filename = _setup(tmpdir, monkeypatch)
+    s = selector.Selector(mapfile=filename, lazy_handlers=True)
+    assert _call(s, '/a') == ['a']
+    s.freeze()
+    assert not isinstance(s.mappings[0].methods['GET'],
+                          selector.LazyHandler)
+    assert _call(s, '/a', 'POST') == ['a']
+    assert s.mappings[0].methods['POST'] is s.mappings[0].methods['GET']
+    assert isinstance(s.mappings[1].methods['GET'], selector.LazyHandler)
+    assert _call(s, '/b') == ['b']
+    assert s.mappings[1].methods['GET'].__name__ == 'wsgi_func'
+
+
+def test_lazy_handlers_with_cache(tmpdir, monkeypatch):
+    """Mapping file caches hand back lazy handlers too."""
+    filename = _setup(tmpdir, monkeypatch)
+    for i in range(2):
+        s = selector.Selector(lazy_handlers=True)
+        s.slurp_file(filename, cached=True)
+        assert 'lazyapps' not in sys.modules
+        assert _call(s, '/c/x') == ['c', 'x']
+        assert s.mappings[2][1]['GET'].__name__ == 'wsgi_func'
+        assert _call(s, '/b') == ['b']
+        del sys.modules['lazyapps']
+
+
+def test_dispatch_source_names_lazy_handlers(tmpdir, monkeypatch):
+    """A dispatch module resolves lazy handlers by their statements."""
+    filename = _setup(tmpdir, monkeypatch)
+    s = selector.Selector(mapfile=filename, lazy_handlers=True)
+    namespace = {}
+    exec(compile(selector.dispatch_source(s), 'dispatch', 'exec'), namespace)
+    app = namespace['select']('/a', 'GET')[0]
+    assert app({}, None) == ['a']
+    app = namespace['select']('/c/x', 'GET')[0]
+    assert app.__name__ == 'wsgi_func'
@@ -0,0 +1,107 @@
+"""Unit test `Selector(lean_args=True)`."""
+
+import re
+
+import selector
+
+
+def _call(s, path, method='GET', environ=None):
+    environ = dict(environ or {}, PATH_INFO=path, REQUEST_METHOD=method)
+    s(environ, lambda status, headers: None)
+    return environ
+
+
+def _app(environ, start_response):
+    return []
+
+
+def test_layout_worked_out_at_add():
+    """Mappings know how their groups become routing args."""
+    s = selector.Selector()
+    s.add('/{user}/tags/{}/{:digits}', GET=_app)
+    regex = s.mappings[0][0]
+    numbers = tuple(regex.groupindex[name]
+                    for name in ('__pos0', '__pos1', 'user'))
+    assert s.mappings[0].layout == (numbers, ('__pos0', '__pos1', 'user'),
+                                    ('user',), ())
+    assert selector._layout({'__pos10': 1, '__pos2': 2, 'n': 3}) == (
+        (1, 2, 3), ('__pos10', '__pos2', 'n'), ('n',), ())
+
+
+def test_lean_routing_args():
+    """Routing args match those of the usual call, less selector.vars."""
+    path = '/bob/' + '/'.join(str(i) for i in range(12))
+    expression = '/{user}' + '/{}' * 12
+    lean = selector.Selector(lean_args=True)
+    lean.add(expression, GET=_app)
+    usual = selector.Selector()
+    usual.add(expression, GET=_app)
+    environ = _call(lean, path)
+    assert 'selector.vars' not in environ
+    assert environ['wsgiorg.routing_args'] == \
+        _call(usual, path)['wsgiorg.routing_args']
+    assert environ['wsgiorg.routing_args'][1] == {'user': 'bob'}
+    assert environ['selector.matches'] == [path]
+    assert environ['PATH_INFO'] == ''
+
+
+def test_lean_adds_to_outer_args():
+    """Routing args from an outer selector come first."""
+    s = selector.Selector(lean_args=True)
+    s.add('/{}/{name}', GET=_app)
+    environ = _call(s, '/x/y', environ={
+        'wsgiorg.routing_args': (['a'], {'b': 'c'})})
+    assert environ['wsgiorg.routing_args'] == (['a', 'x'],
+                                               {'b': 'c', 'name': 'y'})
+
+
+def test_lean_plain_regex_and_frozen():
+    """Plain regexes get a layout when first used; frozen tables work."""
+    s = selector.Selector(lean_args=True, parser=lambda x: x)
+    s.add(r'^/(?P<__pos0>\w+)/(?P<n>\d+)$', GET=_app)
+    s.mappings[0].layout = None
+    args = _call(s, '/a/1')['wsgiorg.routing_args']
+    assert args == (['a'], {'n': '1'})
+    assert s.mappings[0].layout == ((1, 2), ('__pos0', 'n'), ('n',), ())
+    s.freeze()
+    assert _call(s, '/b/2')['wsgiorg.routing_args'] == (['b'], {'n': '2'})
+    assert re.match(s.mappings[0][0].pattern, '/b/2')
+
+
+def test_lean_404_has_no_args():
+    """A path with no mapping gets empty routing args."""
+    s = selector.Selector(lean_args=True)
+    s.add('/{name}', GET=_app)
+    statuses = []
+    environ = {'PATH_INFO': '/a/b', 'REQUEST_METHOD': 'GET'}
+    s(environ, lambda status, headers: statuses.append(status))
+    assert environ['wsgiorg.routing_args'] == ([], {})
+    assert statuses[0].startswith('404')
+
+
+def _not_bad(value):
+    if value == 'bad':
+        raise ValueError(value)
+    return value.upper()
+
+
+def test_lean_args_converted():
+    """Typed captures are converted, and a failed one doesn't match."""
+    parser = selector.SimpleParser(typed=True, converters={'word': _not_bad})
+    s = selector.Selector(lean_args=True, parser=parser)
+    s.add('/{n:digits}/{:word}', GET=_app)
+    s.add('/{name}/{}', GET=_app)
+    assert [position for position, convert in s.mappings[0].layout[3]] == \
+        [0, 1]
+    assert _call(s, '/7/x')['wsgiorg.routing_args'] == (['X'], {'n': 7})
+    assert _call(s, '/7/bad')['wsgiorg.routing_args'] == (['bad'],
+                                                          {'name': '7'})
+    assert s.select('/7/x', 'GET')[1] == {'n': 7, '__pos0': 'X'}
+
+
+def test_lean_args_dfa():
+    """Matches without groups() give their args by name."""
+    s = selector.Selector(lean_args=True, matcher=selector.DfaMatcher)
+    s.add('/{user}/{}', GET=_app)
+    assert _call(s, '/bob/x')['wsgiorg.routing_args'] == (['x'],
+                                                          {'user': 'bob'})
@@ -0,0 +1,158 @@
+"""Unit test caching what was read from mapping files."""
+
+import json
+import sys
+import types
+
+import selector
+
+urls = """\
+/
+    GET selector:expose
+/healthz
+    GET selector:not_found
+@prefix /api
+/users/{id:digits}[/]
+    GET selector:expose
+    POST selector:Naked()
+@wrap selector:pliant
+@parser selector:SimpleParser(typed=True)
+/posts/{id:digits}
+    GET selector:not_found
+/users/{id:digits}
+    PUT selector:not_found
+"""
+
+
+def _write(tmpdir, text=urls):
+    filename = str(tmpdir.join('app.urls'))
+    with open(filename, 'w') as the_file:
+        the_file.write(text)
+    return filename
+
+
+def _answers(s):
+    return [(a[0].__class__, a[1:])
+            for a in (s.select(path, method)
+                      for path in ('/', '/api/healthz', '/api/users/7',
+                                   '/api/posts/1', '/api/users/7/', '/nope')
+                      for method in ('GET', 'POST', 'PUT'))]
+
+
+def test_cache_written_and_used(tmpdir):
+    """A second slurp reads the cache instead of parsing."""
+    filename = _write(tmpdir)
+    plain = selector.Selector(mapfile=filename)
+    first = selector.Selector()
+    first.slurp_file(filename, cached=True)
+    with open(filename + '.cache') as cache_file:
+        cache = json.load(cache_file)
+    assert [route[0] for route in cache['routes']] == [
+        '/', '/api/healthz', '/api/users/{id:digits}[/]',
+        '/api/posts/{id:digits}', '/api/users/{id:digits}']
+    assert cache['routes'][1][3:5] == [None, None]
+    assert cache['routes'][3][3:5] == ['selector:SimpleParser(typed=True)',
+                                       'selector:pliant']
+    calls = []
+
+    class Counting(selector.SimpleParser):
+        def __call__(self, expression):
+            calls.append(expression)
+            return selector.SimpleParser.__call__(self, expression)
+
+        def cache_key(self):
+            return 'counting'
+    cached = selector.Selector(parser=Counting())
+    cached.mapfile_cache = True
+    cached.slurp_file(filename)
+    assert calls == ['/', '/api/healthz']
+    del calls[:]
+    again = selector.Selector(parser=Counting())
+    again.slurp_file(filename, cached=True)
+    assert calls == []
+    assert _answers(again) == _answers(first) == _answers(plain)
+    assert again.select('/api/posts/1', 'GET')[1] == {'id': 1}
+    assert [m.facts for m in again.mappings] == \
+        [m.facts for m in plain.mappings]
+    assert len(again.mappings) == len(plain.mappings) == 5
+
+
+def test_cache_key(tmpdir):
+    """Changing the file or the starting prefix reads the file again."""
+    filename = _write(tmpdir)
+    selector.Selector().slurp_file(filename, cached=True)
+    s = selector.Selector()
+    s.slurp_file(filename, prefix='/v1', cached=True)
+    assert s.mappings[0].expression == '/v1/'
+    assert s.mappings[1].expression == '/api/healthz'
+    _write(tmpdir, urls.replace('/healthz', '/ready'))
+    s = selector.Selector()
+    s.slurp_file(filename, cached=True)
+    assert s.mappings[1].expression == '/api/ready'
+    s = selector.Selector(parser=lambda x: x)
+    s.slurp_file(_write(tmpdir, '^/x$\n    GET selector:expose\n'),
+                 cached=True)
+    assert s.select('/x', 'GET')[0] is selector.expose
+
+
+def test_cache_key_has_parsers_switched_to(tmpdir):
+    """Changing a parser the file switches to reads the file again."""
+    module = sys.modules['mcparser'] = types.ModuleType('mcparser')
+    try:
+        module.P = selector.SimpleParser(patterns={'v': 'a+'})
+        filename = _write(tmpdir, '@parser mcparser:P\n'
+                                  '/x/{v:v}\n    GET selector:expose\n')
+        s = selector.Selector()
+        s.slurp_file(filename, cached=True)
+        assert s.mappings[0][0].pattern.endswith('(?P<v>a+)$')
+        with open(filename + '.cache') as cache_file:
+            assert json.load(cache_file)['parsers'] == ['mcparser:P']
+        module.P = selector.SimpleParser(patterns={'v': 'b+'})
+        s = selector.Selector()
+        s.slurp_file(filename, cached=True)
+        assert s.mappings[0][0].pattern.endswith('(?P<v>b+)$')
+        module.P = lambda expression: '^/y$'
+        s = selector.Selector()
+        s.slurp_file(filename, cached=True)
+        assert s.mappings[0][0].pattern == '^/y$'
+    finally:
+        del sys.modules['mcparser']
+
+
+def test_cache_key_has_module_source(tmpdir):
+    """A cache written by another version of selector isn't used."""
+    filename = _write(tmpdir)
+    selector.Selector().slurp_file(filename, cached=True)
+    real = selector._source_hash
+    selector._source_hash = 'another version'
+    try:
+        s = selector.Selector()
+        loads = []
+        s._load_routes = lambda *args: loads.append(args)
+        s.slurp_file(filename, cached=True)
+    finally:
+        selector._source_hash = real
+    assert loads == []
+    assert len(s.mappings) == 5
+
+
+def test_cache_file_swapped_in(tmpdir):
+    """The cache file is written to the side and renamed into place."""
+    filename = _write(tmpdir)
+    renames = []
+    real = selector._replace
+
+    def replace(source, target):
+        with open(source) as cache_file:
+            renames.append((source, target, json.load(cache_file)['key']))
+        real(source, target)
+    selector._replace = replace
+    try:
+        selector.Selector().slurp_file(filename, cached=True)
+    finally:
+        selector._replace = real
+    assert len(renames) == 1
+    assert renames[0][0].startswith(filename + '.cache.')
+    assert renames[0][1] == filename + '.cache'
+    assert sorted(tmpdir.listdir()) == [tmpdir.join('app.urls'),
+                                        tmpdir.join('app.urls.cache')]
@@ -0,0 +1,73 @@
+"""Unit test merging mappings with the same regex in `Selector.add`."""
+
+import selector
+
+
+class Unmerged(selector.Selector):
+    merge_methods = False
+
+
+def test_add_merges_same_regex():
+    """Methods for the same path expression end up in one mapping."""
+    s = selector.Selector()
+    first = s.add('/ws/{slug}', GET=1)
+    s.add('/other', GET=2)
+    assert s.add('/ws/{slug}', POST=3, GET=4) is first
+    assert len(s.mappings) == 2
+    assert s.mappings[0][1] == {'GET': 1, 'POST': 3}
+    assert s.select('/ws/x', 'POST')[0] == 3
+    assert s.select('/ws/x', 'GET')[0] == 1
+
+
+def test_merge_keeps_first_match():
+    """Mappings aren't merged past others that could match."""
+    routes = [('/items/{id}', {'DELETE': 1}),
+              ('/items/new', {'GET': 2}),
+              ('/items/{id}', {'GET': 3, 'PUT': 4}),
+              ('/any/{x}', {'_ANY_': 5}),
+              ('/any/{x}', {'GET': 6}),
+              ('/items/{id}', {'PATCH': 7})]
+    merged = selector.Selector(mappings=routes)
+    plain = Unmerged(mappings=routes)
+    assert [sorted(m[1]) for m in merged.mappings] == [
+        ['DELETE'], ['GET'], ['GET', 'PATCH', 'PUT'], ['_ANY_'], ['GET']]
+    for path in ('/items/1', '/items/new', '/any/x', '/nope'):
+        for method in ('GET', 'PUT', 'PATCH', 'DELETE', 'POST'):
+            assert merged.select(path, method)[0] == \
+                plain.select(path, method)[0]
+
+
+def test_merge_after_table_changes():
+    """Merging still finds the right mapping after the table changes."""
+    s = selector.Selector()
+    s.add('/a', GET=1)
+    s.add('/b', GET=2)
+    s.mappings = list(reversed(s.mappings))
+    s.add('/a', POST=3)
+    assert [m[1] for m in s.mappings] == [{'GET': 2},
+                                          {'GET': 1, 'POST': 3}]
+    s.freeze()
+    try:
+        s.add('/a', PUT=4)
+    except TypeError:
+        pass
+    else:
+        raise AssertionError('frozen selector took a route')
+    assert 'PUT' not in s.mappings[1].methods
+
+
+def test_merge_methods_split_across_files():
+    """Routes added again for another method merge unless blocked."""
+    s = selector.Selector()
+    for method in ('GET', 'POST'):
+        for i in range(50):
+            s.add('/r%s/{id}' % i, {method: i})
+        s.add('/r7/{id}' if method == 'GET' else '/{x}/new', PUT=99)
+    s.add('/r3/{id}', DELETE=3)
+    assert len(s.mappings) == 52
+    assert sorted(s.mappings[3][1]) == ['GET', 'POST']
+    assert sorted(s.mappings[7][1]) == ['GET', 'POST', 'PUT']
+    assert s.mappings[50][1] == {'PUT': 99}
+    assert s.mappings[51][1] == {'DELETE': 3}
+    assert s.select('/r3/new', 'PUT')[0] == 99
+    assert s.select('/r7/new', 'PUT')[0] == 99
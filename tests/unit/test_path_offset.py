@@ -0,0 +1,113 @@
+"""Unit test consuming the path by offset with `path_offset`."""
+
+import re
+
+import selector
+
+
+def _app(environ, start_response):
+    return [(environ['SCRIPT_NAME'], environ['PATH_INFO'],
+             environ.get('selector.offset'))]
+
+
+def _call(s, path, method='GET'):
+    environ = {'PATH_INFO': path, 'REQUEST_METHOD': method,
+               'SCRIPT_NAME': '/root'}
+    return s(environ, lambda status, headers: None), environ
+
+
+def _tree(**kwargs):
+    inner = selector.Selector(path_offset=True, **kwargs)
+    inner.add('/{name}', GET=_app)
+    inner.add('/{name}/{:digits}', POST=_app)
+    middle = selector.Selector(path_offset=True, **kwargs)
+    middle.add('/users|', GET=inner, POST=inner)
+    outer = selector.Selector(path_offset=True, **kwargs)
+    outer.add('/api|', GET=middle, POST=middle)
+    return outer
+
+
+def test_unanchored():
+    """Anchored regexes lose their ``^``; others can't match at pos."""
+    regex = re.compile(selector.SimpleParser()('/{name}'))
+    assert selector._unanchored(regex).match('/a/b', 2).groupdict() == {
+        'name': 'b'}
+    assert selector._unanchored(re.compile('/a')) is None
+    assert selector._unanchored(re.compile('^a|^b')) is None
+    assert selector._unanchored(re.compile('^a', re.MULTILINE)) is None
+
+
+def test_offset_through_nested_selectors():
+    """Only the last app sees PATH_INFO and SCRIPT_NAME rewritten."""
+    result, environ = _call(_tree(), '/api/users/bob')
+    assert result == [('/root/api/users/bob', '', None)]
+    assert environ['selector.matches'] == ['/api', '/users', '/bob']
+    assert environ['wsgiorg.routing_args'] == ([], {'name': 'bob'})
+
+
+def test_offset_with_other_matchers_and_lean_args():
+    """Matchers without ``matches_at`` and lean args give the same."""
+    for kwargs in ({'matcher': selector.CombinedMatcher},
+                   {'matcher': selector.TrieMatcher},
+                   {'matcher': selector.PruningMatcher},
+                   {'matcher': selector.DfaMatcher},
+                   {'lean_args': True, 'cache_size': 10},
+                   {'by_method': True}):
+        result, environ = _call(_tree(**kwargs), '/api/users/bob/7', 'POST')
+        assert result == [('/root/api/users/bob/7', '', None)]
+        assert environ['wsgiorg.routing_args'] == (['7'], {'name': 'bob'})
+
+
+def test_offset_404_and_405():
+    """A miss deep down is answered with the path rewritten."""
+    statuses = []
+    environ = {'PATH_INFO': '/api/users/bob/7', 'REQUEST_METHOD': 'GET'}
+    _tree()(environ, lambda status, headers: statuses.append(status))
+    assert statuses[0].startswith('405')
+    assert (environ['SCRIPT_NAME'], environ['PATH_INFO']) == \
+        ('/api/users', '/bob/7')
+    assert 'selector.offset' not in environ
+
+
+def test_offset_into_plain_selector():
+    """A selector without `path_offset` gets the usual environ."""
+    inner = selector.Selector()
+    inner.add('/{name}', GET=_app)
+    outer = selector.Selector(path_offset=True)
+    outer.add('/api|', GET=inner)
+    result, environ = _call(outer, '/api/bob')
+    assert result == [('/root/api/bob', '', None)]
+
+
+def test_select_from_pos():
+    """`select` can match the path from an offset."""
+    s = selector.Selector()
+    s.add('/about', GET=2)
+    s.add('/{name}', GET=1)
+    assert s.select('/x/about', 'GET', 2) == (2, {}, ['GET'], '/about')
+    assert s.select('/x/bob', 'GET', 2)[:2] == (1, {'name': 'bob'})
+
+
+def test_matches_at_without_slicing():
+    """Matching from pos finds what matching the rest of the path does."""
+    s = selector.Selector()
+    s.add('/about', GET=_app)
+    s.add('/{name}/{:digits}', GET=_app)
+    s.add('/api/{name}', GET=_app)
+    s.add('/{name}[/{tag:word}]', GET=_app)
+    s.parser = lambda x: x
+    s.add('/x$', GET=_app)
+    s.add(r'^/(?P<a>\w)$', GET=_app)
+    for matcher in (selector.LinearMatcher, selector.CombinedMatcher):
+        m = matcher(s.mappings)
+        for rest in ('/about', '/bob/7', '/api/bob', '/bob/hi', '/x',
+                     '/x\n', '/y', '/', ''):
+            path = '/pre/fix' + rest
+            found = [(index, match.group(0), match.groupdict())
+                     for index, match in m.matches_at(path, 8)]
+            assert found == [(index, match.group(0), match.groupdict())
+                             for index, match in m.matches(rest)]
+        assert [index for index, match in m.matches_at('/pre/fix/x', 8)] \
+            == [3, 4, 5]
+        assert [index for index, match in m.matches_at('/pre/fix/y', 8)] \
+            == [3, 5]
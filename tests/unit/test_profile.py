@@ -0,0 +1,80 @@
+"""Unit test hit profiles and profile guided reordering."""
+
+import json
+import os
+import tempfile
+
+import pytest
+
+import selector
+
+routes = [
+    ('/users/{name}', {'GET': 1}),
+    ('/users/me', {'GET': 2}),
+    ('/about', {'GET': 3}),
+    ('/api/{version}/status', {'GET': 4}),
+    ('/help[/]', {'GET': 5}),
+]
+
+
+def test_disjoint():
+    """Mappings overlap unless their literal segments tell them apart."""
+    s = selector.Selector(mappings=routes)
+    users, me, about, status, help = map(selector._signature, s.mappings)
+    assert not selector._disjoint(users, me)
+    assert selector._disjoint(users, about)
+    assert selector._disjoint(status, help)
+    assert selector._disjoint(about, help)
+    assert not selector._disjoint(None, about)
+
+
+def test_reorder_keeps_overlapping_order():
+    """Hot mappings move up, but never past one they overlap."""
+    s = selector.Selector(mappings=routes)
+    s.reorder({'GET ' + s.mappings[1][0].pattern: 10,
+               'GET ' + s.mappings[4][0].pattern: 5})
+    assert [m[1]['GET'] for m in s.mappings] == [5, 1, 2, 3, 4]
+    assert s.select('/users/me', 'GET')[0] == 1
+
+
+def test_save_and_load_profile():
+    """Hits are counted, saved by route name and used to reorder."""
+    s = selector.Selector(mappings=routes, record_hits=True, cache_size=10)
+    for i in range(3):
+        s.select('/api/v1/status', 'GET')
+    s.select('/about', 'GET')
+    s.select('/nowhere', 'GET')
+    assert s.hits == {3: 3, 2: 1}
+    handle, filename = tempfile.mkstemp()
+    os.close(handle)
+    try:
+        s.save_profile(filename)
+        with open(filename) as the_file:
+            assert sorted(json.load(the_file).values()) == [1, 3]
+        s.load_profile(filename)
+    finally:
+        os.remove(filename)
+    assert [m[1]['GET'] for m in s.mappings] == [4, 3, 1, 2, 5]
+    assert s.hits == {0: 3, 1: 1}
+
+
+def test_save_profile_without_hits():
+    """Saving a profile without counting hits says so."""
+    s = selector.Selector(mappings=routes)
+    with pytest.raises(ValueError):
+        s.save_profile(os.devnull)
+
+
+def test_overlaps():
+    """Only signatures that may share a path are found."""
+    s = selector.Selector(mappings=routes)
+    s.add('/{tenant}/about', GET=7)
+    signatures = [selector._signature(mapping) for mapping in s.mappings]
+    signatures.insert(5, None)
+    overlaps = selector._Overlaps()
+    for number, signature in enumerate(signatures):
+        overlaps.add(number, signature)
+    found = [sorted(overlaps.overlapping(signature))
+             for signature in signatures]
+    assert found == [[0, 1, 5, 6], [0, 1, 5], [2, 5], [3, 5], [4, 5],
+                     [0, 1, 2, 3, 4, 5, 6], [0, 5, 6]]
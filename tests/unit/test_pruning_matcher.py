@@ -0,0 +1,46 @@
+"""Unit test `PruningMatcher`."""
+
+import selector
+
+routes = [
+    ('/api/v2/users/{id:digits}.json', {'GET': 1}),
+    ('/api/v2/users/{id:digits}[/]', {'GET': 2}),
+    ('/a[/b[/{c}]]', {'GET': 3}),
+    ('/files/{path:any}', {'GET': 4}),
+    ('/book/{id}|', {'GET': 5}),
+    ('/api/{rest:any}', {'POST': 6}),
+]
+
+
+def test_features():
+    """Mappings know their prefix, suffix, length and slash counts."""
+    s = selector.Selector(mappings=routes)
+    features = [m.features for m in s.mappings]
+    assert features[0] == ('/api/v2/users/', 4, 4, 20, '.json')
+    assert features[2] == ('/a', 1, 3, 2, '')
+    assert features[3] == ('/files/', 2, None, 8, '')
+    assert features[4] == ('/book/', 2, None, 7, '')
+    s.parser = lambda x: x
+    assert s.add('^/x$', GET=1).features is None
+
+
+def test_grouped_by_first_segment():
+    """Mappings are grouped by the first segment of their prefix."""
+    s = selector.Selector(mappings=routes)
+    matcher = selector.PruningMatcher(s.mappings)
+    assert matcher.heads == {'/api/': [0, 1, 5], '/files/': [3],
+                             '/book/': [4]}
+    assert matcher.general == [2]
+
+
+def test_pruning_agrees_with_linear():
+    """Same answers as a linear scan for every path and method."""
+    pruning = selector.Selector(mappings=routes,
+                                matcher=selector.PruningMatcher)
+    linear = selector.Selector(mappings=routes)
+    for path in ('/api/v2/users/3.json', '/api/v2/users/3/', '/a', '/a/b',
+                 '/a/b/c', '/a/b/c/d', '/files/x/y', '/book/1/x', '/api',
+                 '/api/v2/users/3\n', '', '/'):
+        for method in ('GET', 'POST'):
+            assert (pruning.select(path, method) ==
+                    linear.select(path, method))
@@ -0,0 +1,104 @@
+"""Unit test reloading mapping files."""
+
+import os
+import re
+import time
+
+import selector
+
+first = """\
+/a
+    GET selector:not_found
+"""
+
+second = """\
+/b/{x}
+    GET selector:expose
+"""
+
+broken = """\
+    GET selector:expose
+"""
+
+
+def _write(filename, text):
+    with open(filename, 'w') as the_file:
+        the_file.write(text)
+
+
+def test_reload_swaps_routes(tmpdir):
+    """The new routes replace the old ones, with a new matcher."""
+    filename = str(tmpdir.join('app.urls'))
+    _write(filename, first)
+    s = selector.Selector(mapfile=filename, cache_size=10, by_method=True)
+    assert s.select('/a', 'GET')[0] is selector.not_found
+    old = s._matcher
+    _write(filename, second)
+    s.reload()
+    assert s._matcher is not old and s._matcher.method_tables
+    assert s.select('/a', 'GET')[0] is s.status404
+    assert s.select('/b/1', 'GET')[:2] == (selector.expose, {'x': '1'})
+    s.freeze()
+    _write(filename, first)
+    s.reload()
+    assert isinstance(s.mappings, selector.RouteTable)
+    assert s.select('/a', 'GET')[0] is selector.not_found
+
+
+def test_reload_error_keeps_routes(tmpdir):
+    """A bad mapping file leaves the routes as they were."""
+    filename = str(tmpdir.join('app.urls'))
+    _write(filename, first)
+    s = selector.Selector(mapfile=filename)
+    _write(filename, broken)
+    try:
+        s.reload()
+    except selector.MappingFileError:
+        pass
+    else:
+        raise AssertionError('no error')
+    s.reload(background=True).join()
+    assert isinstance(s.reload_error, selector.MappingFileError)
+    assert s.select('/a', 'GET')[0] is selector.not_found
+    _write(filename, second)
+    s.reload(background=True).join()
+    assert s.reload_error is None
+    assert s.select('/b/1', 'GET')[0] is selector.expose
+
+
+def test_reload_bad_regex_keeps_routes(tmpdir):
+    """A regex that won't compile fails the reload, not a request."""
+    filename = str(tmpdir.join('app.urls'))
+    _write(filename, first)
+    s = selector.Selector(mapfile=filename)
+    _write(filename, '@parser %s:str\n^/b($\n    GET selector:expose\n'
+           % str.__module__)
+    s.reload(background=True).join()
+    assert isinstance(s.reload_error, re.error)
+    assert s.select('/a', 'GET')[0] is selector.not_found
+
+
+def test_watch(tmpdir):
+    """Changes to the file are picked up by the watching thread."""
+    filename = str(tmpdir.join('app.urls'))
+    _write(filename, first)
+    s = selector.Selector(mapfile=filename)
+    thread = s.watch(interval=0.01)
+    try:
+        _write(filename, second + '\n')
+        for i in range(500):
+            if s.select('/b/1', 'GET')[0] is selector.expose:
+                break
+            time.sleep(0.01)
+        assert s.select('/b/1', 'GET')[0] is selector.expose
+    finally:
+        s.unwatch()
+        thread.join()
+    assert os.path.exists(filename)
+
+
+def test_unwatch_before_watch():
+    """Stopping a selector that isn't watching does nothing."""
+    s = selector.Selector()
+    s.unwatch()
+    s.unwatch()
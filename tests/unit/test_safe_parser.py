@@ -0,0 +1,47 @@
+"""Unit test the backtracking-safe mode of `SimpleParser`."""
+
+import re
+
+import selector
+
+
+def test_safe_parser_hardens():
+    """Types nothing after them could match are made possessive."""
+    parser = selector.SimpleParser(safe=True)
+    regex = parser('/u/{id:digits}[/{name:word}]')
+    plain = selector.SimpleParser()('/u/{id:digits}[/{name:word}]')
+    if selector._possessive:
+        assert parser.unsafe == []
+        assert regex == plain.replace('+', '++')
+    else:
+        assert parser.unsafe == ['/u/{id:digits}[/{name:word}]']
+        assert regex == plain
+    match = re.match(regex, '/u/12/bob')
+    assert match.groupdict() == {'id': '12', 'name': 'bob'}
+
+
+def test_safe_parser_reports():
+    """Routes that can't be fully hardened are listed."""
+    parser = selector.SimpleParser(safe=True)
+    regex = parser('/files/{path:any}/{name}.{ext}')
+    parser('/s/{a:segment}-{b}')
+    parser('/s/{a:segment}-{b}')
+    parser('/n/{x:number}')
+    assert parser.unsafe == ['/files/{path:any}/{name}.{ext}',
+                             '/s/{a:segment}-{b}', '/n/{x:number}']
+    if selector._possessive:
+        assert r'(?P<path>.+)' in regex
+        assert r'(?P<ext>[^/^.]++)$' in regex
+    match = re.match(regex, '/files/a/b/c.txt')
+    assert match.groupdict() == {'path': 'a/b', 'name': 'c', 'ext': 'txt'}
+
+
+def test_safe_selector():
+    """A selector with a safe parser routes just as before."""
+    s = selector.Selector(parser=selector.SimpleParser(safe=True))
+    s.add('/files/{path:any}/{name}.{ext}', GET=1)
+    s.add('/u/{id:digits}[/{name:word}]', GET=2)
+    assert s.select('/files/x/y.z', 'GET')[:2] == (
+        1, {'path': 'x', 'name': 'y', 'ext': 'z'})
+    assert s.select('/u/7', 'GET')[:2] == (2, {'id': '7', 'name': None})
+    assert s.select('/u/7/', 'GET')[0] is s.status404
@@ -0,0 +1,45 @@
+"""Unit test caching `Selector.select()` results."""
+
+import selector
+
+
+def test_cache_hits_and_misses():
+    """Repeated lookups are answered from the cache."""
+    s = selector.Selector(cache_size=2)
+    s.add('/hello/{name}', GET=1)
+    assert s.select('/hello/bob', 'GET') == (1, {'name': 'bob'}, ['GET'],
+                                             '/hello/bob')
+    svars = s.select('/hello/bob', 'GET')[1]
+    svars['name'] = 'changed'
+    assert s.select('/hello/bob', 'GET')[1] == {'name': 'bob'}
+    assert (s.cache.hits, s.cache.misses, s.cache.evictions) == (2, 1, 0)
+
+
+def test_cache_evicts_least_recently_used():
+    """The oldest key goes when the cache is full."""
+    s = selector.Selector(cache_size=2)
+    s.add('/{x}', GET=1)
+    s.select('/a', 'GET')
+    s.select('/b', 'GET')
+    s.select('/a', 'GET')
+    s.select('/c', 'GET')
+    assert list(s.cache.data.keys()) == [('/a', 'GET'), ('/c', 'GET')]
+    assert s.cache.evictions == 1
+    assert len(s.cache) == 2
+
+
+def test_cache_cleared_on_add():
+    """Adding a mapping clears the cache."""
+    s = selector.Selector(cache_size=10)
+    s.add('/a', POST=1)
+    assert s.select('/a', 'GET')[0] is s.status405
+    s.add('/a', GET=2)
+    assert len(s.cache) == 0
+    assert s.select('/a', 'GET')[0] == 2
+    s.slurp([('/b', {'GET': 3})])
+    assert len(s.cache) == 0
+
+
+def test_no_cache_by_default():
+    """Caching is opt in."""
+    assert selector.Selector().cache is None
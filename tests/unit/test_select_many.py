@@ -0,0 +1,66 @@
+"""Unit test `Selector.select_many`."""
+
+import selector
+
+
+def _selector():
+    s = selector.Selector()
+    s.add('/users/{name}', GET=1, PUT=2)
+    s.add('/users/{name}/posts/{id:digits}', GET=3)
+    s.add('/static/{path:any}', _ANY_=4)
+    s.parser = lambda x: x
+    s.add(r'^\/raw$', GET=5)
+    return s
+
+
+def test_select_many_agrees_with_select():
+    """Each request gets the mapping `select` would pick."""
+    s = _selector()
+    s.add(r'^\/r\/(?P<r>\w+)$', GET=6)
+    paths = ['/users/bob', '/users/bob/posts/7', '/static/a/b.css',
+             '/users/bob', '/nope', '/r/x', '/users/bob']
+    methods = ['GET', 'GET', 'POST', 'PUT', 'GET', 'GET', 'DELETE']
+    indexes, columns = s.select_many(paths, methods)
+    assert indexes == [0, 1, 2, 0, -1, 4, -1]
+    assert columns == {
+        'name': ['bob', 'bob', None, 'bob', None, None, None],
+        'id': [None, '7', None, None, None, None, None],
+        'path': [None, None, 'a/b.css', None, None, None, None],
+        'r': [None, None, None, None, None, 'x', None]}
+    for path, method, index in zip(paths, methods, indexes):
+        app = s.select(path, method)[0]
+        if index < 0:
+            assert app in (s.status404, s.status405)
+        else:
+            assert app is s.mappings[index][1].get(method,
+                                                   s.mappings[index][1].get(
+                                                       '_ANY_'))
+
+
+def test_select_many_without_methods():
+    """Without methods only the path counts."""
+    s = _selector()
+    indexes, columns = s.select_many(iter(['/raw', '/users/x', '/a']))
+    assert indexes == [3, 0, -1]
+    assert columns == {'name': [None, 'x', None]}
+
+
+def test_select_chunks():
+    """Input is read in chunks and columns line up across them."""
+    s = _selector()
+    paths = ['/static/x', '/users/a', '/users/a', '/raw', '/users/b/posts/1']
+    chunks = list(s.select_chunks(paths, chunk_size=2, memo_size=1))
+    assert [c[0] for c in chunks] == [[2, 0], [0, 3], [1]]
+    assert chunks[1][1] == {'name': ['a', None]}
+    indexes, columns = s.select_many(paths, chunk_size=2)
+    assert indexes == [2, 0, 0, 3, 1]
+    assert columns['path'] == ['x', None, None, None, None]
+    assert columns['id'] == [None, None, None, None, '1']
+    assert s.select_many([]) == ([], {})
+
+
+def test_prefix_candidates():
+    """Paths only get the mappings whose prefix they start with."""
+    prefixes = {'': [3], '/a/': [0, 4], '/b': [1]}
+    assert selector._prefix_candidates(['/a/x', '/bc', '/c'], prefixes) == [
+        [0, 3, 4], [1, 3], [3]]
@@ -30,3 +30,70 @@ def test_parser_with_custom_type():
     assert parser('/{foo:mytype}') == r'^\/(?P<foo>MYREGEX)$'
     parser.patterns['othertype'] = 'OTHERREGEX'
     assert parser('/{foo:othertype}') == r'^\/(?P<foo>OTHERREGEX)$'
+
+
+def test_parser_parse_tree():
+    """Path expressions can be taken apart instead of turned into regex."""
+    parser = selector.SimpleParser()
+    assert parser.parse('/a/{}/{b:digits}[.{ext}]') == ([
+        ('literal', '/a/'),
+        ('capture', '__pos0', 'chunk'),
+        ('literal', '/'),
+        ('capture', 'b', 'digits'),
+        ('optional', [('literal', '.'), ('capture', 'ext', 'chunk')]),
+    ], False)
+    assert parser.parse('/book/{id}|') == ([('literal', '/book/'),
+                                            ('capture', 'id', 'chunk')],
+                                           True)
+
+
+def test_parser_renders_from_tree():
+    """The regex is rendered from the parse tree."""
+    parser = selector.SimpleParser()
+    with open('tests/unit/path-expressions.csv', 'r') as pex:
+        for line in pex:
+            pe = line.strip()
+            nodes, openended = parser.parse(pe)
+            regex = parser.render(nodes)
+            assert parser(pe) in ('^%s$' % regex, '^%s' % regex)
+
+
+def test_parser_delimiter_edge_cases():
+    """Closing delimiters with no opening ones are plain text."""
+    parser = selector.SimpleParser()
+    assert parser.parse('/a]b') == ([('literal', '/a]b')], False)
+    assert parser.parse('/a[b[c]]') == ([
+        ('literal', '/a'),
+        ('optional', [('literal', 'b'), ('optional', [('literal', 'c')])]),
+    ], False)
+    assert parser.parse('/{}[{}]{:digits}') == ([
+        ('literal', '/'),
+        ('capture', '__pos0', 'chunk'),
+        ('optional', [('capture', '__pos1', 'chunk')]),
+        ('capture', '__pos2', 'digits'),
+    ], False)
+    for broken in ('/a]b[c', '/a[b]]', '/[[a]'):
+        with pytest.raises(selector.PathExpressionParserError):
+            parser(broken)
+
+
+def test_add_parses_once():
+    """`add` parses an expression once and keeps the tree on the mapping."""
+    parses = []
+
+    class Counting(selector.SimpleParser):
+        def parse(self, url_pattern):
+            parses.append(url_pattern)
+            return selector.SimpleParser.parse(self, url_pattern)
+
+        def cache_key(self):
+            return None
+    s = selector.Selector(parser=Counting(), matcher=selector.TrieMatcher)
+    s.add('/users/{id:digits}[/]', GET=1, name='user')
+    s.add('/users/{id:digits}[/]', POST=2)
+    assert s.select('/users/1/', 'POST')[0] == 2
+    assert s.url_for('user', id=3) == '/users/3'
+    assert selector._signature(s.mappings[0]) is not None
+    assert selector._program(s.mappings[0]) is not None
+    assert len(parses) == 2
+    assert s.mappings[0].tree == s.parser.parse('/users/{id:digits}[/]')
@@ -0,0 +1,45 @@
+"""Unit test `TrieMatcher`."""
+
+import selector
+
+routes = [
+    ('/users/{name}', {'GET': 1}),
+    ('/users/me', {'GET': 2, 'PUT': 3}),
+    ('/users/{id:digits}/posts[/]', {'GET': 4}),
+    ('/files/{path:any}', {'GET': 5}),
+    ('/docs/{doc}.{ext}', {'GET': 6}),
+    ('/book/{id}|', {'GET': 7}),
+    ('/healthz', {'_ANY_': 8}),
+]
+
+paths = ['/users/bob', '/users/me', '/users/12/posts', '/users/12/posts/',
+         '/users/x/posts', '/files/a/b.c', '/docs/readme.txt', '/docs/x',
+         '/book/3/chapter/4', '/healthz', '/healthz\n', '/nope', '',
+         '/users//posts']
+
+
+def test_trie_agrees_with_linear():
+    """Same answers as a linear scan for every path and method."""
+    trie = selector.Selector(mappings=routes, matcher=selector.TrieMatcher)
+    linear = selector.Selector(mappings=routes)
+    for path in paths:
+        for method in ('GET', 'PUT', 'POST'):
+            assert trie.select(path, method) == linear.select(path, method)
+
+
+def test_trie_structure():
+    """Literal segments are dict keys; unsafe expressions fall back."""
+    s = selector.Selector(mappings=routes)
+    matcher = selector.TrieMatcher(s.mappings)
+    assert matcher.fallback == [3, 5]
+    users = matcher.root.literals[''].literals['users']
+    assert users.literals['me'].routes == [1]
+    assert len(users.patterns) == 2
+
+
+def test_trie_plain_regex_fallback():
+    """Plain regexes are scanned in order."""
+    s = selector.Selector(parser=lambda x: x, matcher=selector.TrieMatcher)
+    s.add(r'^\/x\/(?P<n>\d+)$', GET=1)
+    assert s.select('/x/5', 'GET') == (1, {'n': '5'}, ['GET'], '/x/5')
+    assert selector.TrieMatcher(s.mappings).fallback == [0]
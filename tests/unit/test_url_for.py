@@ -0,0 +1,70 @@
+"""Unit test building URLs for named routes."""
+
+import pytest
+
+import selector
+
+
+def _selector():
+    s = selector.Selector(prefix='/app')
+    s.add('/book/{book_id:digits}[/{slug}]', GET=1, name='book')
+    s.add('/users/{name}[/]', GET=2, name='user')
+    s.add('/files/{path:any}', GET=3, name='file')
+    s.add('/{}/{}', GET=4, name='pair')
+    return s
+
+
+def test_url_for():
+    """URLs are built from the route's path expression."""
+    s = _selector()
+    assert s.url_for('book', book_id=3) == '/app/book/3'
+    assert s.url_for('book', book_id=3, slug='dune') == '/app/book/3/dune'
+    assert s.url_for('user', name='bob') == '/app/users/bob'
+    assert s.url_for('file', path='a/b c.txt') == '/app/files/a/b%20c.txt'
+    assert s.url_for('pair', 'x', 'y') == '/app/x/y'
+    for url in ('/app/book/3/dune', '/app/files/a/b', '/app/x/y'):
+        assert s.select(url, 'GET')[0] in (1, 3, 4)
+
+
+def test_url_for_checks_values():
+    """Missing, unused and badly typed values are refused."""
+    s = _selector()
+    with pytest.raises(ValueError):
+        s.url_for('book', slug='dune')
+    with pytest.raises(ValueError):
+        s.url_for('book', book_id='x')
+    with pytest.raises(ValueError):
+        s.url_for('user', name='a.b')
+    with pytest.raises(ValueError):
+        s.url_for('user', name='bob', other=1)
+    with pytest.raises(KeyError):
+        s.url_for('nope')
+
+
+def test_url_for_partly_given_optional():
+    """Values for an optional part left out are refused, not dropped."""
+    s = selector.Selector()
+    s.add('/book/{id:digits}[/{a}/{b}]', GET=1, name='book')
+    with pytest.raises(ValueError) as info:
+        s.url_for('book', id=3, a='x')
+    assert 'a' in str(info.value)
+    assert s.url_for('book', id=3) == '/book/3'
+    assert s.url_for('book', id=3, a='x', b='y') == '/book/3/x/y'
+
+
+def test_url_templates_are_kept():
+    """Each set of names gets its format made once."""
+    template = _selector().named['book']
+    template(book_id=1)
+    template(book_id=2)
+    template(book_id=2, slug='x')
+    assert sorted(map(sorted, template.plans)) == [['book_id'],
+                                                   ['book_id', 'slug']]
+    assert template.plans[frozenset(['book_id'])][0] == '/app/book/%(book_id)s'
+
+
+def test_name_needs_parse():
+    """Routes of parsers that can't parse can't be named."""
+    s = selector.Selector(parser=lambda x: x)
+    with pytest.raises(ValueError):
+        s.add('^/raw$', GET=1, name='raw')
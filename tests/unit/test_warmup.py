@@ -0,0 +1,41 @@
+"""Unit test `Selector.warmup`."""
+
+import gc
+
+import selector
+
+
+def test_warmup_counts_and_builds():
+    """Matchers are built and lazy handlers resolved, nested ones too."""
+    inner = selector.Selector(by_method=True)
+    inner.add('/x/{y}', GET=selector.not_found)
+    inner.add('/z', POST=selector.LazyHandler('selector:expose',
+                                              selector.resolver.resolve, {}))
+    outer = selector.Selector(matcher=selector.TrieMatcher)
+    outer.add('/a', GET=selector.not_found, POST=selector.not_found)
+    outer.add('/in[/{rest:any}]', _ANY_=inner)
+    outer.add('/again', GET=inner)
+    counts = outer.warmup(freeze_gc=False)
+    assert counts == {'selectors': 2, 'routes': 5, 'regexes': 5,
+                      'handlers': 4, 'resolved': 1, 'compiled': 0}
+    assert isinstance(outer._matcher, selector.TrieMatcher)
+    assert isinstance(inner._matcher, selector.LinearMatcher)
+    assert inner._matcher.method_tables
+    assert inner.mappings[1][1]['POST'] is selector.expose
+    assert outer.warmup(freeze_gc=False)['resolved'] == 0
+
+
+def test_warmup_frozen_table_and_gc():
+    """Frozen tables warm up too, and the collector is frozen."""
+    s = selector.Selector()
+    s.add('/b', GET=selector.LazyHandler('selector:expose',
+                                         selector.resolver.resolve, {}))
+    s.freeze()
+    try:
+        assert s.warmup()['resolved'] == 1
+        if hasattr(gc, 'freeze'):
+            assert gc.get_freeze_count() > 0
+    finally:
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+    assert s.select('/b', 'GET')[0] is selector.expose